@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
+import os
+import tempfile
 import unittest
+import numpy as np
 
 class Node:
+    __slots__ = ('val', 'left_child', 'right_child')
 
     def __init__(self, val):
         self.val = val
@@ -9,10 +13,148 @@ class Node:
         self.right_child = None
 
 
+class TreeIndex:
+    """
+    Index of a static binary tree: a value -> node map, parents and depths
+    of the nodes, built in O(n), so ancestors of a node are found in O(depth).
+    On the first lowest common ancestor query an Euler tour of the tree with
+    a sparse table of the shallowest nodes of its ranges is built in O(n log n),
+    after that the lowest common ancestor of two nodes is found in O(1).
+    Supposes that there are no duplicates in the tree.
+    """
+
+    def __init__(self, head):
+        self.nodes = nodes = [] # node id -> Node, ids are given in preorder
+        self.ids = ids = {} # value -> node id
+        self.parent = parent = [] # node id -> parent id, -1 for the head
+        depth = []
+        stack = [(head, -1, 0)] if head is not None else [] # node, parent id, depth
+        while stack:
+            node, parent_id, node_depth = stack.pop()
+            node_id = len(nodes)
+            nodes.append(node)
+            if node.val not in ids:
+                ids[node.val] = node_id
+            parent.append(parent_id)
+            depth.append(node_depth)
+            if node.right_child is not None:
+                stack.append((node.right_child, node_id, node_depth + 1))
+            if node.left_child is not None:
+                stack.append((node.left_child, node_id, node_depth + 1))
+        self.depth = np.array(depth, dtype=np.int64)
+        self.euler = None # node ids in the order of the Euler tour
+        self.first = None # node id -> position of its first visit in the tour
+        self.sparse = None
+
+    def _build_sparse(self):
+        """ Builds the Euler tour and its sparse table for the lowest common ancestor queries """
+        parent = self.parent
+        euler = [0] if self.nodes else []
+        current = 0
+        # in preorder every node follows its parent or a node of the subtree of its parent
+        for node_id in range(1, len(self.nodes)):
+            while current != parent[node_id]:
+                current = parent[current]
+                euler.append(current)
+            euler.append(node_id)
+            current = node_id
+        while current > 0:
+            current = parent[current]
+            euler.append(current)
+        self.euler = np.array(euler, dtype=np.int64)
+        self.first = np.zeros(len(self.nodes), dtype=np.int64)
+        # the first visits of nodes are the last occurrences in the reversed tour
+        self.first[self.euler[::-1]] = np.arange(len(euler) - 1, -1, -1)
+        self.sparse = [self.euler]
+        span = 1
+        while 2 * span <= len(euler):
+            prev = self.sparse[-1]
+            left, right = prev[:-span], prev[span:]
+            self.sparse.append(np.where(self.depth[left] <= self.depth[right], left, right))
+            span *= 2
+
+    def iter_ancestors(self, val):
+        """
+        Lazily yields values of the ancestors of val from the closest to the farthest.
+        Throws an error if val is not found
+        """
+        if not self.nodes:
+            raise RuntimeError('The tree is empty')
+        if val not in self.ids:
+            raise RuntimeError('The vertex not found in the tree')
+        node_id = self.parent[self.ids[val]]
+        while node_id != -1:
+            yield self.nodes[node_id].val
+            node_id = self.parent[node_id]
+
+    def ancestors(self, val):
+        """ Returns values of the ancestors of val from the farthest to the closest in O(depth) """
+        ancestors = list(self.iter_ancestors(val))
+        ancestors.reverse()
+        return ancestors
+
+    def node(self, val):
+        """ Returns the node with value val, throws an error if not found """
+        if val not in self.ids:
+            raise RuntimeError('The vertex {0} not found in the tree'.format(str(val)))
+        return self.nodes[self.ids[val]]
+
+    def _check_pair(self, val1, val2):
+        if not self.nodes:
+            raise RuntimeError('The tree is empty')
+        if val1 == val2:
+            raise RuntimeError('{0} == {1}: there are no duplicates in the tree'.format(str(val1), str(val2)))
+        if (val1 not in self.ids) or (val2 not in self.ids):
+            raise RuntimeError('Some of the vertices not found in the tree')
+        return self.ids[val1], self.ids[val2]
+
+    def lowest_common_ancestor(self, val1, val2):
+        """ Returns the Lowest Common Ancestor value of val1 and val2 in O(1), otherwise throws an error """
+        id1, id2 = self._check_pair(val1, val2)
+        if self.sparse is None:
+            self._build_sparse()
+        i, j = sorted((int(self.first[id1]), int(self.first[id2])))
+        level = (j - i + 1).bit_length() - 1
+        left = self.sparse[level][i]
+        right = self.sparse[level][j - (1 << level) + 1]
+        return self.nodes[left if self.depth[left] <= self.depth[right] else right].val
+
+    def lowest_common_ancestors(self, pairs):
+        """
+        Returns a list of Lowest Common Ancestor values of (val1, val2) pairs.
+        Range queries of all the pairs are answered at once with NumPy.
+        Throws an error if any of the pairs is not valid
+        """
+        pair_ids = np.array([self._check_pair(val1, val2) for val1, val2 in pairs], dtype=np.int64)
+        if len(pair_ids) == 0:
+            return []
+        if self.sparse is None:
+            self._build_sparse()
+        bounds = np.sort(self.first[pair_ids], axis=1)
+        i, j = bounds[:, 0], bounds[:, 1]
+        levels = np.floor(np.log2(j - i + 1)).astype(np.int64)
+        result = np.empty(len(pair_ids), dtype=np.int64)
+        for level in np.unique(levels).tolist():
+            mask = levels == level
+            left = self.sparse[level][i[mask]]
+            right = self.sparse[level][j[mask] - (1 << level) + 1]
+            result[mask] = np.where(self.depth[left] <= self.depth[right], left, right)
+        return [self.nodes[k].val for k in result.tolist()]
+
+
 class BinaryTree:
 
     def __init__(self):
         self.head = None
+        self.index = None
+
+    def build_index(self):
+        """
+        Builds a TreeIndex of the tree for fast queries. The index should be
+        built again if the tree changes (build_from_list drops it)
+        """
+        self.index = TreeIndex(self.head)
+        return self.index
 
     def build_from_list(self, val_list):
         """
@@ -27,46 +169,78 @@ class BinaryTree:
         |
         d
         """
-        def add_nodes(val_list):
-            if val_list == []:
-                return None
-            new_node = Node(val_list[0])
-            new_node.left_child = add_nodes(val_list[1])
-            new_node.right_child = add_nodes(val_list[2])           
-            return new_node
-        self.head = add_nodes(val_list)
+        # explicit stack of (node list, parent node, is left child) for deep trees
+        self.head = None
+        stack = [(val_list, None, False)]
+        while stack:
+            node_list, parent, is_left = stack.pop()
+            if node_list == []:
+                continue
+            new_node = Node(node_list[0])
+            if parent is None:
+                self.head = new_node
+            elif is_left:
+                parent.left_child = new_node
+            else:
+                parent.right_child = new_node
+            stack.append((node_list[2], new_node, False))
+            stack.append((node_list[1], new_node, True))
+        self.index = None
+
+    def _find_paths(self, vals):
+        """
+        Returns a dict val -> values on the path from the head to the first node
+        (in preorder) with value val, inclusive, for the found vals.
+        An iterative dfs with an explicit stack, so deep trees are fine
+        """
+        paths = {}
+        path = []
+        stack = [(self.head, 0)] if self.head != None else []
+        while stack and len(paths) < len(vals):
+            node, depth = stack.pop()
+            del path[depth:]
+            path.append(node.val)
+            if (node.val in vals) and (node.val not in paths):
+                paths[node.val] = list(path)
+            if node.right_child != None:
+                stack.append((node.right_child, depth + 1))
+            if node.left_child != None:
+                stack.append((node.left_child, depth + 1))
+        return paths
 
     def print_ancestors(self, val):
         """
         Prints out the ancestors in the format: "ancestor -> ... -> ancestor -> val"
         Returns values of ancestors (excluding val itself) in order from farthest to closest
         """
-        def recursive_print_ancestors(val, node):
-            # dfs modification
-            found = False
-            ancestors = []
-            if node.val == val:
-                found = True
-            if (node.left_child != None) and not found:
-                [found, ancestors] = recursive_print_ancestors(val, node.left_child)
-                if found:
-                    ancestors.append(node.val)
-            if (node.right_child != None) and not found:
-                [found, ancestors] = recursive_print_ancestors(val, node.right_child)
-                if found:
-                    ancestors.append(node.val)
-            return [found, ancestors]
+        ancestors = self.ancestors(val)
+        print(' -> '.join([str(x) for x in ancestors] + [str(val),]))
+        return ancestors
+
+    def ancestors(self, val):
+        """
+        Returns values of ancestors of val (excluding val itself) in order from farthest
+        to closest without printing them. Uses the TreeIndex of the tree if it is built
+        """
+        if self.index is not None:
+            return self.index.ancestors(val)
 
         if self.head == None:
             raise RuntimeError('The tree is empty')
 
-        [found, ancestors] = recursive_print_ancestors(val, self.head)
-        ancestors.reverse()
-        if not found:
+        paths = self._find_paths((val,))
+        if val not in paths:
             raise RuntimeError('The vertex not found in the tree')
-        else:
-            print(' -> '.join([str(x) for x in ancestors] + [str(val),]))
-        return ancestors
+        return paths[val][:-1]
+
+    def iter_ancestors(self, val):
+        """
+        Lazily yields values of ancestors of val from closest to farthest
+        using the TreeIndex of the tree, which is built on the first call
+        """
+        if self.index is None:
+            self.build_index()
+        return self.index.iter_ancestors(val)
 
     def lowest_common_ancestor(self, val1, val2):
         """ 
@@ -76,53 +250,8 @@ class BinaryTree:
         Returns the Lowest Ancestor value, if found, otherwise throws an error
         """
 
-        def recursive_val_search(val1, val2, _a, _c, node):
-            # dfs modification
-            a = _a
-            c = _c
-            if (node.val == val1) or (node.val == val2):
-                if a == 1:
-                    # found the second vertex
-                    return [1, 1, None]
-                else:
-                    # found the 1st vertex; current vertex could be LA
-                    # if we find another one in subtrees. Mark as [0, 1]
-                    c = 1
-            LA = None
-
-            # below we are looking for vertices in the subtrees
-            # case 1: already found a candidate for LA, looking for another vertex. Mark as [1, 0]
-            # case 2: haven't found any candidate for LA. Mark as [0, 0]
-
-            # don't update [a, c] in case we haven't found the second vertex and
-            # we want to propagate the candidate (marked [0, 1]) above
-
-            if (node.left_child != None):
-                if a + c == 1:
-                    [a_new, c_new, LA] = recursive_val_search(val1, val2, 1, 0, node.left_child)
-                elif a + c == 0:
-                    [a_new, c_new, LA] = recursive_val_search(val1, val2, 0, 0, node.left_child)
-                if (a == 0) and (c == 1):
-                    if (a_new == 1) and (c_new == 1):
-                        # print(node.val)
-                        LA = node.val
-                        a, c = a_new, c_new
-                else:
-                    a, c = a_new, c_new
-
-            if (node.right_child != None):
-                if a + c == 1:
-                    [a_new, c_new, LA] = recursive_val_search(val1, val2, 1, 0, node.right_child)
-                elif a + c == 0:
-                    [a_new, c_new, LA] = recursive_val_search(val1, val2, 0, 0, node.right_child)
-                if (a == 0) and (c == 1):
-                    if (a_new == 1) and (c_new == 1):
-                        LA = node.val
-                        a, c = a_new, c_new
-                else:
-                    a, c = a_new, c_new
-
-            return [a, c, LA]
+        if self.index is not None:
+            return self.index.lowest_common_ancestor(val1, val2)
 
         if self.head == None:
             raise RuntimeError('The tree is empty')
@@ -130,11 +259,272 @@ class BinaryTree:
         if (val1 == val2):
             raise RuntimeError('{0} == {1}: there are no duplicates in the tree'.format(str(val1), str(val2)))
 
-        [a, c, LA] = recursive_val_search(val1, val2, 0, 0, self.head)
-        if (LA == None):
+        paths = self._find_paths((val1, val2))
+        if len(paths) < 2:
+            raise RuntimeError('Some of the vertices not found in the tree')
+        # the LA is the last common value of the paths from the head
+        LA = None
+        for x, y in zip(paths[val1], paths[val2]):
+            if x != y:
+                break
+            LA = x
+        return LA
+
+    def lowest_common_ancestors(self, pairs):
+        """
+        Returns a list of Lowest Common Ancestor values of (val1, val2) pairs
+        using the TreeIndex of the tree, which is built on the first call.
+        Throws an error if any of the pairs is not valid
+        """
+        if self.index is None:
+            self.build_index()
+        return self.index.lowest_common_ancestors(pairs)
+
+    def lowest_common_ancestors_offline(self, pairs):
+        """
+        Yields (lca, error) pairs for (val1, val2) pairs in input order, answering
+        the whole batch in one dfs by Tarjan's offline algorithm in O(n + q * alpha(n))
+        without building an index. For a valid pair lca is the Lowest Common Ancestor
+        value and error is None. For an invalid pair lca is None and error is
+        the RuntimeError that lowest_common_ancestor would throw, so the batch goes on
+        """
+        pairs = list(pairs)
+        results = {} # query number -> answer, a buffer to restore the input order
+        queries = {} # value -> numbers of queries with it
+        for i, (val1, val2) in enumerate(pairs):
+            if self.head == None:
+                results[i] = (None, RuntimeError('The tree is empty'))
+            elif val1 == val2:
+                results[i] = (None, RuntimeError('{0} == {1}: there are no duplicates in the tree'.format(
+                    str(val1), str(val2))))
+            else:
+                queries.setdefault(val1, []).append(i)
+                queries.setdefault(val2, []).append(i)
+        next_result = 0
+        while next_result in results:
+            yield results.pop(next_result)
+            next_result += 1
+
+        # union-find over node ids with union by size and path halving;
+        # ancestor[root] is the value of the deepest node on the path of its set
+        uf_parent, uf_size, ancestor = [], [], []
+        ids = {} # value -> node id of the first node in preorder
+        finished = [] # node id -> the node and its subtree are done
+
+        def find(x):
+            while uf_parent[x] != x:
+                uf_parent[x] = uf_parent[uf_parent[x]]
+                x = uf_parent[x]
+            return x
+
+        def add_node(node):
+            node_id = len(uf_parent)
+            uf_parent.append(node_id)
+            uf_size.append(1)
+            ancestor.append(node.val)
+            finished.append(False)
+            ids.setdefault(node.val, node_id)
+            return node_id
+
+        stack = [[self.head, add_node(self.head), 0]] if self.head != None else [] # node, id, next child
+        while stack:
+            top = stack[-1]
+            node, node_id, next_child = top
+            if next_child < 2:
+                top[2] += 1
+                child = node.left_child if next_child == 0 else node.right_child
+                if child != None:
+                    stack.append([child, add_node(child), 0])
+                continue
+            stack.pop()
+            finished[node_id] = True
+            if ids[node.val] == node_id:
+                for i in queries.get(node.val, ()):
+                    val1, val2 = pairs[i]
+                    other = ids.get(val2 if node.val == val1 else val1)
+                    if (other is not None) and finished[other]:
+                        results[i] = (ancestor[find(other)], None)
+            if stack:
+                # the subtree of the node joins the set of its parent
+                parent_id = stack[-1][1]
+                root1, root2 = find(parent_id), find(node_id)
+                if uf_size[root1] < uf_size[root2]:
+                    root1, root2 = root2, root1
+                uf_parent[root2] = root1
+                uf_size[root1] += uf_size[root2]
+                ancestor[root1] = stack[-1][0].val
+            while next_result in results:
+                yield results.pop(next_result)
+                next_result += 1
+
+        for i in range(next_result, len(pairs)):
+            yield results.get(i, (None, RuntimeError('Some of the vertices not found in the tree')))
+
+
+class ArrayBinaryTree:
+    """
+    Compact binary tree stored as parallel int64 arrays of values and left, right,
+    parent node ids (-1 for none). Nodes are numbered in preorder, so the head is 0.
+    Saved as a single (4, n) .npy file, which can be memory-mapped on load.
+    Supposes that there are no duplicates in the tree.
+    """
+
+    def __init__(self, values, left, right, parent=None):
+        self.values = np.asarray(values, dtype=np.int64)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        if parent is None:
+            parent = np.full(len(self.values), -1, dtype=np.int64)
+            for children in (self.left, self.right):
+                has_child = children != -1
+                parent[children[has_child]] = np.nonzero(has_child)[0]
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self._depth = None
+        self._order = None # node ids sorted by value, for the value lookup
+        self._sorted_values = None
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_list(cls, val_list):
+        """ Builds the tree from a list in the format of BinaryTree.build_from_list """
+        values, left, right = [], [], []
+        # explicit stack of (node list, parent id, children list of the parent)
+        stack = [(val_list, -1, None)]
+        while stack:
+            node_list, parent_id, children = stack.pop()
+            if node_list == []:
+                continue
+            node_id = len(values)
+            if children is not None:
+                children[parent_id] = node_id
+            values.append(node_list[0])
+            left.append(-1)
+            right.append(-1)
+            stack.append((node_list[2], node_id, right))
+            stack.append((node_list[1], node_id, left))
+        return cls(values, left, right)
+
+    @classmethod
+    def from_tree(cls, btree):
+        """ Builds the tree from a BinaryTree, whose values should be integers """
+        values, left, right = [], [], []
+        stack = [(btree.head, -1, None)] if btree.head != None else []
+        while stack:
+            node, parent_id, children = stack.pop()
+            node_id = len(values)
+            if children is not None:
+                children[parent_id] = node_id
+            values.append(node.val)
+            left.append(-1)
+            right.append(-1)
+            if node.right_child != None:
+                stack.append((node.right_child, node_id, right))
+            if node.left_child != None:
+                stack.append((node.left_child, node_id, left))
+        return cls(values, left, right)
+
+    def to_tree(self):
+        """ Returns a BinaryTree of Node objects with the same structure """
+        nodes = [Node(val) for val in self.values.tolist()]
+        for node, left, right in zip(nodes, self.left.tolist(), self.right.tolist()):
+            if left != -1:
+                node.left_child = nodes[left]
+            if right != -1:
+                node.right_child = nodes[right]
+        btree = BinaryTree()
+        btree.head = nodes[0] if nodes else None
+        return btree
+
+    def save(self, path):
+        """ Saves the tree to path as a (4, n) int64 .npy array of values, left, right, parent """
+        np.save(path, np.stack([self.values, self.left, self.right, self.parent]))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """ Loads a tree saved by save, memory-mapped unless mmap_mode is None """
+        arrays = np.load(path, mmap_mode=mmap_mode)
+        if (arrays.ndim != 2) or (arrays.shape[0] != 4):
+            raise RuntimeError('{0} is not a saved ArrayBinaryTree'.format(str(path)))
+        return cls(arrays[0], arrays[1], arrays[2], arrays[3])
+
+    @property
+    def depth(self):
+        """ Depths of the nodes, computed on the first access by pointer jumping in O(n log(depth)) """
+        if self._depth is None:
+            depth = (self.parent != -1).astype(np.int64)
+            jump = np.array(self.parent)
+            active = np.nonzero(jump != -1)[0]
+            while len(active):
+                up = jump[active]
+                depth[active] += depth[up]
+                jump[active] = jump[up]
+                active = active[jump[active] != -1]
+            self._depth = depth
+        return self._depth
+
+    def node_id(self, val):
+        """ Returns the id of the node with value val or -1, using a lazily built sorted index """
+        if self._order is None:
+            self._order = np.argsort(self.values, kind='mergesort')
+            self._sorted_values = self.values[self._order]
+        i = int(np.searchsorted(self._sorted_values, val))
+        if (i == len(self._sorted_values)) or (self._sorted_values[i] != val):
+            return -1
+        return int(self._order[i])
+
+    def iter_ancestors(self, val):
+        """
+        Lazily yields values of ancestors of val from closest to farthest.
+        Throws an error if val is not found
+        """
+        if len(self) == 0:
+            raise RuntimeError('The tree is empty')
+        node_id = self.node_id(val)
+        if node_id == -1:
+            raise RuntimeError('The vertex not found in the tree')
+        node_id = int(self.parent[node_id])
+        while node_id != -1:
+            yield int(self.values[node_id])
+            node_id = int(self.parent[node_id])
+
+    def ancestors(self, val):
+        """ Returns values of ancestors of val (excluding val itself) in order from farthest to closest """
+        ancestors = list(self.iter_ancestors(val))
+        ancestors.reverse()
+        return ancestors
+
+    def print_ancestors(self, val):
+        """
+        Prints out the ancestors in the format: "ancestor -> ... -> ancestor -> val"
+        Returns values of ancestors (excluding val itself) in order from farthest to closest
+        """
+        ancestors = self.ancestors(val)
+        print(' -> '.join([str(x) for x in ancestors] + [str(val),]))
+        return ancestors
+
+    def lowest_common_ancestor(self, val1, val2):
+        """
+        Returns the Lowest Common Ancestor value of val1 and val2 in O(depth),
+        otherwise throws an error
+        """
+        if len(self) == 0:
+            raise RuntimeError('The tree is empty')
+        if (val1 == val2):
+            raise RuntimeError('{0} == {1}: there are no duplicates in the tree'.format(str(val1), str(val2)))
+        id1, id2 = self.node_id(val1), self.node_id(val2)
+        if (id1 == -1) or (id2 == -1):
             raise RuntimeError('Some of the vertices not found in the tree')
-        else:
-            return LA
+        depth = self.depth
+        # lift the deeper node to the depth of the other one, then both together
+        while depth[id1] > depth[id2]:
+            id1 = int(self.parent[id1])
+        while depth[id2] > depth[id1]:
+            id2 = int(self.parent[id2])
+        while id1 != id2:
+            id1, id2 = int(self.parent[id1]), int(self.parent[id2])
+        return int(self.values[id1])
 
 
 class TestBinaryTree(unittest.TestCase):
@@ -213,5 +603,195 @@ class TestBinaryTree(unittest.TestCase):
             btree.lowest_common_ancestor(5, 5)
 
 
+    def test_deep_tree(self):
+        # a degenerate tree 0 -> 1 -> ... -> depth-1, alternating left and right children
+        depth = 20000
+        tree_list = []
+        for val in range(depth - 1, -1, -1):
+            tree_list = [val, tree_list, []] if val % 2 else [val, [], tree_list]
+        btree = BinaryTree()
+        btree.build_from_list(tree_list)
+
+        self.assertEqual(btree.ancestors(depth - 1), list(range(depth - 1)))
+        self.assertEqual(btree.ancestors(3), [0, 1, 2])
+        self.assertEqual(btree.lowest_common_ancestor(depth - 1, 5000), 5000)
+        self.assertEqual(btree.lowest_common_ancestor(12345, 777), 777)
+        with self.assertRaises(RuntimeError):
+            btree.lowest_common_ancestor(depth, 1)
+
+        btree.build_index()
+        self.assertEqual(btree.ancestors(3), [0, 1, 2])
+        self.assertEqual(btree.lowest_common_ancestor(depth - 1, 5000), 5000)
+
+        with self.assertRaises(AttributeError):
+            btree.head.color = 'red'
+
+    def test_lca_index(self):
+        tree_list = [1, [2, [], []], [5, [8, [6, [], []], []], [10, [4, [], []], []]]]
+        btree = BinaryTree()
+        btree.build_from_list(tree_list)
+        values = [1, 2, 5, 8, 6, 10, 4]
+        pairs = [(a, b) for a in values for b in values if a != b]
+        expected = [btree.lowest_common_ancestor(a, b) for a, b in pairs]
+
+        index = btree.build_index()
+        self.assertEqual([index.lowest_common_ancestor(a, b) for a, b in pairs], expected)
+        self.assertEqual(btree.lowest_common_ancestors(pairs), expected)
+        self.assertEqual(btree.lowest_common_ancestors([]), [])
+        self.assertEqual(index.node(8).left_child.val, 6)
+
+        # the same errors as lowest_common_ancestor
+        with self.assertRaises(RuntimeError):
+            btree.lowest_common_ancestor(5, 5)
+        with self.assertRaises(RuntimeError):
+            btree.lowest_common_ancestor(5, 21)
+        with self.assertRaises(RuntimeError):
+            btree.lowest_common_ancestors([(2, 6), (42, 7)])
+        with self.assertRaises(RuntimeError):
+            index.node(21)
+        with self.assertRaises(RuntimeError):
+            BinaryTree().lowest_common_ancestors([(1, 2)])
+
+    def test_ancestors_index(self):
+        tree_list = [1, [2, [], []], [5, [8, [6, [], []], []], [10, [4, [], []], []]]]
+        btree = BinaryTree()
+        btree.build_from_list(tree_list)
+        expected = {val: btree.ancestors(val) for val in [1, 2, 5, 8, 6, 10, 4]}
+        self.assertEqual(expected[4], [1, 5, 10])
+
+        self.assertEqual(list(btree.iter_ancestors(6)), [8, 5, 1])
+        self.assertIsNotNone(btree.index)
+        # parent pointers are enough, the LCA tables are built on the first LCA query
+        self.assertIsNone(btree.index.sparse)
+        self.assertEqual(btree.lowest_common_ancestors([(6, 4)]), [5])
+        self.assertIsNotNone(btree.index.sparse)
+        for val, ancestors in expected.items():
+            self.assertEqual(btree.ancestors(val), ancestors)
+            self.assertEqual(btree.print_ancestors(val), ancestors)
+        with self.assertRaises(RuntimeError):
+            btree.ancestors(21)
+        with self.assertRaises(RuntimeError):
+            next(btree.iter_ancestors(21))
+        with self.assertRaises(RuntimeError):
+            next(BinaryTree().iter_ancestors(1))
+
+    def test_lca_index_random(self):
+        np.random.seed(0)
+        for k in range(10):
+            # random tree: every new value becomes a free child of a random node
+            n = np.random.randint(2, 60)
+            tree_list = [0, [], []]
+            free = [(tree_list, 1), (tree_list, 2)]
+            for val in range(1, n):
+                parent, side = free.pop(np.random.randint(len(free)))
+                parent[side] = [val, [], []]
+                free += [(parent[side], 1), (parent[side], 2)]
+            btree = BinaryTree()
+            btree.build_from_list(tree_list)
+            pairs = [tuple(p) for p in np.random.randint(0, n, size=(50, 2)).tolist() if p[0] != p[1]]
+            expected = [btree.lowest_common_ancestor(a, b) for a, b in pairs]
+            self.assertEqual(btree.lowest_common_ancestors(pairs), expected)
+
+
+    def test_lca_offline(self):
+        tree_list = [1, [2, [], []], [5, [8, [6, [], []], []], [10, [4, [], []], []]]]
+        btree = BinaryTree()
+        btree.build_from_list(tree_list)
+        values = [1, 2, 5, 8, 6, 10, 4]
+        pairs = [(a, b) for a in values for b in values if a != b]
+        expected = [btree.lowest_common_ancestor(a, b) for a, b in pairs]
+        self.assertEqual(list(btree.lowest_common_ancestors_offline(pairs)), [(lca, None) for lca in expected])
+        self.assertEqual(list(btree.lowest_common_ancestors_offline(iter([]))), [])
+
+        # invalid pairs are reported in place
+        results = list(btree.lowest_common_ancestors_offline([(6, 4), (5, 5), (42, 7), (2, 21), (4, 10)]))
+        self.assertEqual(results[0], (5, None))
+        for lca, error in results[1:4]:
+            self.assertIsNone(lca)
+            self.assertIsInstance(error, RuntimeError)
+        self.assertEqual(results[4], (10, None))
+        [(lca, error)] = BinaryTree().lowest_common_ancestors_offline([(1, 2)])
+        self.assertIsNone(lca)
+        self.assertIsInstance(error, RuntimeError)
+
+        # random trees against the index, on a deep degenerate tree as well
+        rng = np.random.RandomState(3)
+        for n in (2, 50, 300):
+            order = rng.permutation(n).tolist()
+            btree.head = Node(order[0])
+            nodes = [btree.head]
+            for val in order[1:]:
+                node = Node(val)
+                while True:
+                    parent = nodes[rng.randint(len(nodes))]
+                    if rng.randint(2) and parent.left_child == None:
+                        parent.left_child = node
+                        break
+                    if parent.right_child == None:
+                        parent.right_child = node
+                        break
+                nodes.append(node)
+            pairs = [tuple(pair) for pair in rng.randint(0, n, size=(200, 2)).tolist() if pair[0] != pair[1]]
+            index = TreeIndex(btree.head)
+            self.assertEqual([lca for lca, error in btree.lowest_common_ancestors_offline(pairs)],
+                index.lowest_common_ancestors(pairs))
+        tree_list = []
+        for val in range(19999, -1, -1):
+            tree_list = [val, tree_list, []] if val % 2 else [val, [], tree_list]
+        btree.build_from_list(tree_list)
+        self.assertEqual(list(btree.lowest_common_ancestors_offline([(19999, 5000), (777, 12345)])),
+            [(5000, None), (777, None)])
+
+    def test_array_tree(self):
+        tree_list = [1, [2, [], []], [5, [8, [6, [], []], []], [10, [4, [], []], []]]]
+        btree = BinaryTree()
+        btree.build_from_list(tree_list)
+        atree = ArrayBinaryTree.from_list(tree_list)
+        self.assertEqual(atree.values.tolist(), [1, 2, 5, 8, 6, 10, 4])
+        self.assertEqual(atree.left.tolist(), [1, -1, 3, 4, -1, 6, -1])
+        self.assertEqual(atree.right.tolist(), [2, -1, 5, -1, -1, -1, -1])
+        self.assertEqual(atree.parent.tolist(), [-1, 0, 0, 2, 3, 2, 5])
+        self.assertEqual(atree.depth.tolist(), [0, 1, 1, 2, 3, 2, 3])
+        self.assertEqual(ArrayBinaryTree.from_tree(btree).values.tolist(), atree.values.tolist())
+        self.assertEqual(ArrayBinaryTree.from_tree(atree.to_tree()).right.tolist(), atree.right.tolist())
+
+        values = atree.values.tolist()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tree.npy')
+            atree.save(path)
+            loaded = ArrayBinaryTree.load(path)
+            self.assertIsInstance(loaded.values.base, np.memmap)
+            for val in values:
+                self.assertEqual(loaded.print_ancestors(val), btree.ancestors(val))
+            self.assertEqual(list(loaded.iter_ancestors(4)), [10, 5, 1])
+            for a in values:
+                for b in values:
+                    if a != b:
+                        self.assertEqual(loaded.lowest_common_ancestor(a, b), btree.lowest_common_ancestor(a, b))
+            del loaded
+
+        with self.assertRaises(RuntimeError):
+            atree.ancestors(21)
+        with self.assertRaises(RuntimeError):
+            atree.lowest_common_ancestor(5, 5)
+        with self.assertRaises(RuntimeError):
+            atree.lowest_common_ancestor(5, 21)
+        empty = ArrayBinaryTree.from_list([])
+        self.assertIsNone(empty.to_tree().head)
+        with self.assertRaises(RuntimeError):
+            empty.ancestors(1)
+
+    def test_array_tree_deep(self):
+        depth = 20000
+        tree_list = []
+        for val in range(depth - 1, -1, -1):
+            tree_list = [val, tree_list, []] if val % 2 else [val, [], tree_list]
+        atree = ArrayBinaryTree.from_list(tree_list)
+        self.assertEqual(atree.depth.tolist(), list(range(depth)))
+        self.assertEqual(atree.ancestors(depth - 1), list(range(depth - 1)))
+        self.assertEqual(atree.lowest_common_ancestor(12345, 777), 777)
+        self.assertEqual(atree.to_tree().ancestors(3), [0, 1, 2])
+
+
 if __name__ == '__main__':
     unittest.main()
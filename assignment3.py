@@ -1,5 +1,14 @@
 #!/usr/bin/env python3
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
 import unittest
+from array import array
+from bisect import bisect_left
+from multiprocessing import Pool
 
 class WordDict():
 
@@ -14,6 +23,169 @@ class WordDict():
         return string in self.prefixes
 
 
+MAPPED_DICT_MAGIC = b'WDCT'
+MAPPED_DICT_HEADER = '<4sIII'
+
+
+class TrieNode():
+    __slots__ = ('children', 'is_word', 'n_words')
+
+    def __init__(self):
+        self.children = {}
+        self.is_word = False
+        self.n_words = 0 # number of words in the subtree, including the node itself
+
+
+class TrieWordDict():
+    """
+    Dictionary of words stored in a trie. Supports the WordDict interface
+    and is walked node by node by word_search_trie, so no prefixes are stored
+    """
+
+    def __init__(self, words):
+        self.root = TrieNode()
+        for word in words:
+            self.addWord(word)
+
+    def addWord(self, word):
+        nodes = [self.root]
+        for ch in word:
+            nodes.append(nodes[-1].children.setdefault(ch, TrieNode()))
+        if not nodes[-1].is_word:
+            nodes[-1].is_word = True
+            for node in nodes:
+                node.n_words += 1
+
+    def child(self, node, string):
+        """ Returns the node reached from node by the letters of string, None if there is no such node """
+        for ch in string:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def isTerminal(self, node):
+        return node.is_word
+
+    def wordCount(self, node):
+        return node.n_words
+
+    def isWord(self, string):
+        node = self.child(self.root, string)
+        return (node is not None) and self.isTerminal(node)
+
+    def isPrefix(self, string):
+        return self.child(self.root, string) is not None
+
+    def save(self, path):
+        """ 
+        Writes the trie to a file in the flat format read by MappedWordDict:
+        a header (magic, version, n_nodes, n_edges) followed by uint32 arrays
+        first_edge[n_nodes+1], word_count[n_nodes], labels[n_edges], targets[n_edges]
+        and uint8 array is_word[n_nodes]. Nodes are numbered in BFS order, the root is 0,
+        labels (code points of letters) of the edges of every node are sorted
+        """
+        nodes = [self.root]
+        first_edge = array('I', [0])
+        labels = array('I')
+        targets = array('I')
+        for node in nodes: # nodes grows while we iterate over it
+            for ch in sorted(node.children):
+                labels.append(ord(ch))
+                targets.append(len(nodes))
+                nodes.append(node.children[ch])
+            first_edge.append(len(labels))
+        word_count = array('I', [node.n_words for node in nodes])
+        is_word = bytes(node.is_word for node in nodes)
+        with open(path, 'wb') as f:
+            f.write(struct.pack(MAPPED_DICT_HEADER, MAPPED_DICT_MAGIC, 1, len(nodes), len(labels)))
+            for arr in (first_edge, word_count, labels, targets):
+                if sys.byteorder != 'little':
+                    arr.byteswap()
+                arr.tofile(f)
+            f.write(is_word)
+
+
+class MappedWordDict():
+    """ 
+    Dictionary of words in the flat trie format written by TrieWordDict.save.
+    The file is memory-mapped and queried in place without parsing, so opening
+    is instant and processes opening the same file share its pages.
+    Supports the same interface as TrieWordDict, nodes are integers
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = 0
+        header_size = struct.calcsize(MAPPED_DICT_HEADER)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < header_size:
+                raise RuntimeError('{0} is not a word dictionary file'.format(path))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_nodes, n_edges = struct.unpack_from(MAPPED_DICT_HEADER, self._mmap)
+        if (magic != MAPPED_DICT_MAGIC) or (version != 1):
+            self.close()
+            raise RuntimeError('{0} is not a word dictionary file'.format(path))
+        expected_size = header_size + 4 * (2 * n_nodes + 1 + 2 * n_edges) + n_nodes
+        size = len(self._mmap)
+        if size != expected_size:
+            self.close()
+            raise RuntimeError('Word dictionary file {0} has {1} bytes, its header declares {2}'.format(
+                path, size, expected_size))
+        if sys.byteorder != 'little':
+            self.close()
+            raise RuntimeError('Word dictionary files can be mapped on little-endian machines only')
+        view = memoryview(self._mmap)
+        self._views = [view]
+        offset = header_size
+        for name, length in (('first_edge', n_nodes + 1), ('word_count', n_nodes),
+                             ('labels', n_edges), ('targets', n_edges)):
+            arr = view[offset:offset + 4 * length].cast('I')
+            self._views.append(arr)
+            setattr(self, name, arr)
+            offset += 4 * length
+        self.is_word = view[offset:offset + n_nodes]
+        self._views.append(self.is_word)
+
+    def child(self, node, string):
+        """ Returns the node reached from node by the letters of string, None if there is no such node """
+        for ch in string:
+            lo = self.first_edge[node]
+            hi = self.first_edge[node + 1]
+            code = ord(ch)
+            k = bisect_left(self.labels, code, lo, hi)
+            if (k == hi) or (self.labels[k] != code):
+                return None
+            node = self.targets[k]
+        return node
+
+    def isTerminal(self, node):
+        return bool(self.is_word[node])
+
+    def wordCount(self, node):
+        return self.word_count[node]
+
+    def isWord(self, string):
+        node = self.child(self.root, string)
+        return (node is not None) and self.isTerminal(node)
+
+    def isPrefix(self, string):
+        return self.child(self.root, string) is not None
+
+    def close(self):
+        for view in reversed(getattr(self, '_views', [])):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __getstate__(self):
+        # other processes map the same file instead of receiving a copy
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
 def form_prefixes(words):
     """ 
     Input:
@@ -23,7 +195,7 @@ def form_prefixes(words):
     """
     prefixes = set()
     for word in words:
-        for i in range(len(words)):
+        for i in range(len(word)):
             prefixes.add(word[:i+1])
     return prefixes
 
@@ -64,6 +236,160 @@ def word_search(n_rows, n_cols, ch_grid, w_dict):
     return total_words
 
 
+def backtracking_DFS(i, j, prefix, visited, n_rows, n_cols, ch_grid, w_dict, words):
+    """ 
+    Recursive auxiliary function for word_search_backtracking. Marks the cell (i, j)
+    in the visited bytearray for the time of the search and adds words to words set
+    """
+    potential_w = prefix + ch_grid[i][j]
+    if not w_dict.isPrefix(potential_w):
+        return
+    if w_dict.isWord(potential_w):
+        words.add(potential_w)
+    visited[i * n_cols + j] = 1
+    for m in range(max(0, i-1), min(n_rows, i+2)):
+        for n in range(max(0, j-1), min(n_cols, j+2)):
+            if not visited[m * n_cols + n]:
+                backtracking_DFS(m, n, potential_w, visited, n_rows, n_cols, ch_grid, w_dict, words)
+    visited[i * n_cols + j] = 0
+
+
+def word_search_backtracking(n_rows, n_cols, ch_grid, w_dict, start_rows=None):
+    """ 
+    Same as word_search, but visited cells are marked and unmarked in place
+    in a single bytearray and found words go to a single set, so no sets are
+    copied or merged on the way
+
+    Input and output are the same as for word_search, plus
+        start_rows: range of rows of cells where words may start, all rows by default
+    """
+    total_words = set()
+    visited = bytearray(n_rows * n_cols)
+    for i in (range(n_rows) if start_rows is None else start_rows):
+        for j in range(n_cols):
+            backtracking_DFS(i, j, '', visited, n_rows, n_cols, ch_grid, w_dict, total_words)
+    return total_words
+
+
+def word_search_trie(n_rows, n_cols, ch_grid, t_dict, start_rows=None):
+    """ 
+    Same as word_search, but walks a trie dictionary (e.g. TrieWordDict) node by node
+    instead of building and checking prefix strings. Words found once are pruned
+    for the rest of the search, so branches without words left are skipped
+
+    Input:
+        n_rows, n_cols, ch_grid: same as for word_search
+        t_dict: instance of TrieWordDict class
+        start_rows: range of rows of cells where words may start, all rows by default
+    Output:
+        total_words: set of all words found in ch_grid that are present in t_dict
+    """
+    found = {} # terminal node -> word
+    words_left = {} # node -> number of words left in the subtree, if some were found
+    visited = bytearray(n_rows * n_cols)
+    path = []
+
+    def trie_DFS(i, j, node):
+        """ Returns the number of new words found starting from the cell (i, j) """
+        node = t_dict.child(node, ch_grid[i][j])
+        if node is None:
+            return 0
+        left = words_left.get(node)
+        if left is None:
+            left = t_dict.wordCount(node)
+        if left == 0:
+            return 0
+        new_words = 0
+        path.append(ch_grid[i][j])
+        visited[i * n_cols + j] = 1
+        if t_dict.isTerminal(node) and (node not in found):
+            found[node] = ''.join(path)
+            new_words += 1
+        for m in range(max(0, i-1), min(n_rows, i+2)):
+            for n in range(max(0, j-1), min(n_cols, j+2)):
+                if (new_words < left) and not visited[m * n_cols + n]:
+                    new_words += trie_DFS(m, n, node)
+        visited[i * n_cols + j] = 0
+        path.pop()
+        words_left[node] = left - new_words
+        return new_words
+
+    for i in (range(n_rows) if start_rows is None else start_rows):
+        for j in range(n_cols):
+            trie_DFS(i, j, t_dict.root)
+    return set(found.values())
+
+
+def search_any(n_rows, n_cols, ch_grid, w_dict, start_rows=None):
+    """ Runs word_search_trie for trie dictionaries and word_search_backtracking otherwise """
+    if hasattr(w_dict, 'root'):
+        return word_search_trie(n_rows, n_cols, ch_grid, w_dict, start_rows)
+    return word_search_backtracking(n_rows, n_cols, ch_grid, w_dict, start_rows)
+
+
+_worker_dict = None
+
+
+def _init_search_worker(w_dict):
+    """ Pool initializer: keeps the dictionary in the worker for all of its tasks """
+    global _worker_dict
+    _worker_dict = w_dict
+
+
+def _search_task(task):
+    """ Pool task: searches words starting in rows row_from..row_to-1 of a grid """
+    grid_id, ch_grid, row_from, row_to = task
+    n_rows = len(ch_grid)
+    n_cols = len(ch_grid[0]) if n_rows else 0
+    if row_to is None:
+        row_to = n_rows
+    return grid_id, search_any(n_rows, n_cols, ch_grid, _worker_dict, range(row_from, row_to))
+
+
+def batch_word_search(grids, w_dict, n_workers=None, chunksize=1):
+    """ 
+    Searches words of one prebuilt dictionary in many grids with a pool of processes.
+    The dictionary is passed to every worker once, when the worker starts
+    (inherited without copying where processes are forked).
+
+    Input:
+        grids: iterable of ch_grid matrices, ids of the grids are their positions,
+               or a dict of ch_grid matrices, ids of the grids are their keys
+        w_dict: instance of WordDict or TrieWordDict class
+        n_workers: int, number of processes, defaults to the number of CPUs
+        chunksize: int, number of grids sent to a worker at once
+    Output:
+        generator of (grid_id, words) pairs in the order in which grids are done,
+        words is the set of all words found in the grid
+    """
+    tasks = grids.items() if isinstance(grids, dict) else enumerate(grids)
+    with Pool(n_workers, _init_search_worker, (w_dict,)) as pool:
+        for result in pool.imap_unordered(_search_task,
+                ((grid_id, ch_grid, 0, None) for grid_id, ch_grid in tasks), chunksize):
+            yield result
+
+
+def word_search_parallel(n_rows, n_cols, ch_grid, w_dict, n_workers=None, n_stripes=None):
+    """ 
+    Same as word_search, but words starting in different stripes of rows
+    of a single grid are searched in a pool of processes
+
+    Input and output are the same as for word_search, plus
+        n_workers: int, number of processes, defaults to the number of CPUs
+        n_stripes: int, number of stripes of rows, defaults to the number of rows
+    """
+    if n_rows * n_cols == 0:
+        return set()
+    n_stripes = min(n_rows, n_stripes or n_rows)
+    bounds = [n_rows * k // n_stripes for k in range(n_stripes + 1)]
+    total_words = set()
+    with Pool(n_workers, _init_search_worker, (w_dict,)) as pool:
+        tasks = [(k, ch_grid, bounds[k], bounds[k+1]) for k in range(n_stripes)]
+        for k, words in pool.imap_unordered(_search_task, tasks):
+            total_words.update(words)
+    return total_words
+
+
 class TestWordSearch(unittest.TestCase):
 
     def test_simple(self):
@@ -101,6 +427,125 @@ class TestWordSearch(unittest.TestCase):
         ch_grid = [['A', 'B', 'C'], ['D', 'E', 'F'], ['H', 'I', 'J']]
         self.assertEqual(word_search(3, 3, ch_grid, wdict), {'ABC', 'AEI'})
 
+    def test_backtracking(self):
+        words = set({'ABCD', 'ABCDA', 'AC', 'ACA'})
+        wdict = WordDict(words, form_prefixes(words))
+        ch_grid = [['A', 'B'], ['D', 'C']]
+        self.assertEqual(word_search_backtracking(2, 2, ch_grid, wdict), {'ABCD', 'AC'})
+        self.assertEqual(word_search_backtracking(0, 0, [], wdict), set())
+        random.seed(1)
+        for k in range(20):
+            words = {''.join(random.choice('ABCDE') for i in range(random.randint(1, 6)))
+                for w in range(30)}
+            wdict = WordDict(words, form_prefixes(words))
+            ch_grid = [[random.choice('ABCDE') for j in range(5)] for i in range(3)]
+            self.assertEqual(word_search_backtracking(3, 5, ch_grid, wdict),
+                word_search(3, 5, ch_grid, wdict))
+
+    def test_form_prefixes(self):
+        self.assertEqual(form_prefixes({'CART'}), {'C', 'CA', 'CAR', 'CART'})
+
+
+class TestWordSearchTrie(unittest.TestCase):
+
+    def test_simple(self):
+        tdict = TrieWordDict({'CAR', 'CARD', 'CART', 'CAT'})
+        ch_grid = [['A', 'A', 'R'], ['T', 'C', 'D']]
+        self.assertEqual(word_search_trie(2, 3, ch_grid, tdict), {'CAR', 'CARD', 'CAT'})
+
+    def test_empty(self):
+        tdict = TrieWordDict(set())
+        ch_grid = [['A', 'A', 'R'], ['T', 'C', 'D']]
+        self.assertEqual(word_search_trie(2, 3, ch_grid, tdict), set())
+        tdict = TrieWordDict({'CAR', 'CARD', 'CART', 'CAT'})
+        self.assertEqual(word_search_trie(0, 0, [], tdict), set())
+
+    def test_visit_same_cell(self):
+        tdict = TrieWordDict({'ABCD', 'ABCDA', 'AC', 'ACA'})
+        ch_grid = [['A', 'B'], ['D', 'C']]
+        self.assertEqual(word_search_trie(2, 2, ch_grid, tdict), {'ABCD', 'AC'})
+
+    def test_word_dict_interface(self):
+        words = {'ABC', 'CA', 'AEI', 'AJ', 'DF'}
+        tdict = TrieWordDict(words)
+        ch_grid = [['A', 'B', 'C'], ['D', 'E', 'F'], ['H', 'I', 'J']]
+        self.assertTrue(tdict.isWord('AEI'))
+        self.assertFalse(tdict.isWord('AE'))
+        self.assertTrue(tdict.isPrefix('AE'))
+        self.assertFalse(tdict.isPrefix('AB C'))
+        self.assertEqual(word_search(3, 3, ch_grid, tdict), {'ABC', 'AEI'})
+        self.assertEqual(word_search_trie(3, 3, ch_grid, tdict), {'ABC', 'AEI'})
+
+    def test_mapped_dict(self):
+        words = {'CAR', 'CARD', 'CART', 'CAT', 'ÉTÉ', 'É'}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'words.dict')
+            TrieWordDict(words).save(path)
+            mdict = MappedWordDict(path)
+            for string in ('CAR', 'CA', 'C', 'CARTS', 'T', 'É', 'ÉT', 'ÉTÉ', 'ÉTÉS'):
+                self.assertEqual(mdict.isWord(string), string in words)
+                self.assertEqual(mdict.isPrefix(string), string in form_prefixes(words))
+            ch_grid = [['A', 'A', 'R'], ['T', 'C', 'D']]
+            self.assertEqual(word_search_trie(2, 3, ch_grid, mdict), {'CAR', 'CARD', 'CAT'})
+            self.assertEqual(word_search(2, 3, ch_grid, mdict), {'CAR', 'CARD', 'CAT'})
+            results = dict(batch_word_search([ch_grid, [['C', 'A']]], mdict, n_workers=2))
+            self.assertEqual(results, {0: {'CAR', 'CARD', 'CAT'}, 1: set()})
+            mdict.close()
+            with open(path, 'rb') as f:
+                data = f.read()
+            for broken in (b'not a dictionary', b'', data[:10], data[:-1], data + b'\0'):
+                with open(path, 'wb') as f:
+                    f.write(broken)
+                with self.assertRaises(RuntimeError):
+                    MappedWordDict(path)
+
+    def test_random_grids(self):
+        random.seed(0)
+        for k in range(20):
+            words = {''.join(random.choice('ABCDE') for i in range(random.randint(1, 6)))
+                for w in range(30)}
+            ch_grid = [[random.choice('ABCDE') for j in range(4)] for i in range(4)]
+            wdict = WordDict(words, form_prefixes(words))
+            tdict = TrieWordDict(words)
+            self.assertEqual(word_search_trie(4, 4, ch_grid, tdict),
+                word_search(4, 4, ch_grid, wdict))
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, 'words.dict')
+                tdict.save(path)
+                mdict = MappedWordDict(path)
+                self.assertEqual(word_search_trie(4, 4, ch_grid, mdict),
+                    word_search(4, 4, ch_grid, wdict))
+                mdict.close()
+
+
+
+class TestBatchWordSearch(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(2)
+        self.words = {''.join(random.choice('ABCDE') for i in range(random.randint(2, 6)))
+            for w in range(50)}
+        self.wdict = WordDict(self.words, form_prefixes(self.words))
+        self.grids = [[[random.choice('ABCDE') for j in range(4)] for i in range(3)]
+            for k in range(10)]
+
+    def test_batch(self):
+        expected = {k: word_search(3, 4, ch_grid, self.wdict) for k, ch_grid in enumerate(self.grids)}
+        for w_dict in (self.wdict, TrieWordDict(self.words)):
+            results = dict(batch_word_search(self.grids, w_dict, n_workers=2))
+            self.assertEqual(results, expected)
+        named_grids = {'grid_{0}'.format(k): ch_grid for k, ch_grid in enumerate(self.grids[:3])}
+        results = dict(batch_word_search(named_grids, self.wdict, n_workers=2))
+        self.assertEqual(results, {'grid_{0}'.format(k): expected[k] for k in range(3)})
+
+    def test_parallel_start_points(self):
+        ch_grid = [[random.choice('ABCDE') for j in range(6)] for i in range(5)]
+        expected = word_search(5, 6, ch_grid, self.wdict)
+        self.assertEqual(word_search_parallel(5, 6, ch_grid, self.wdict, n_workers=2), expected)
+        self.assertEqual(word_search_parallel(5, 6, ch_grid, TrieWordDict(self.words),
+            n_workers=2, n_stripes=2), expected)
+        self.assertEqual(word_search_parallel(0, 0, [], self.wdict, n_workers=2), set())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
+import mmap
+import os
+import tempfile
 import unittest
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
 class UnionFindElement():
@@ -46,6 +51,318 @@ class UnionFind():
         return x
 
 
+def _label_row(row, base):
+    """
+    Labels runs of land in a boolean row with consecutive integers starting from base.
+    Returns an array with a label for every column (-1 for water) and the number of runs
+    """
+    padded = np.zeros(len(row) + 2, dtype=np.int8)
+    padded[1:-1] = row
+    bounds = np.flatnonzero(np.diff(padded))
+    starts, ends = bounds[::2], bounds[1::2]
+    labels = np.full(len(row), -1, dtype=np.int64)
+    labels[row] = np.repeat(np.arange(base, base + len(starts)), ends - starts)
+    return labels, len(starts)
+
+
+def _seam_pairs(upper, lower):
+    """
+    Returns pairs of labels of land cells that touch each other across two adjacent rows
+    """
+    touch = (upper >= 0) & (lower >= 0)
+    upper = upper[touch]
+    lower = lower[touch]
+    # labels of a run are contiguous along the row, so repeated pairs are adjacent
+    keep = np.ones(len(upper), dtype=bool)
+    keep[1:] = (upper[1:] != upper[:-1]) | (lower[1:] != lower[:-1])
+    return upper[keep].tolist(), lower[keep].tolist()
+
+
+def _find_root(parent, x):
+    """ Returns the root of x in a flat parent array, halving the path on the way """
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+class ArrayUnionFind():
+    """
+    This is an implementation of a union-find (disjoint-set) data structure
+    over dense integer keys 0..size-1, where parents, ranks and set sizes
+    are stored in preallocated flat arrays instead of per-element objects
+    """
+
+    def __init__(self, size):
+        self.parent = array('l', [-1]) * size # -1 marks keys that are not in any set
+        self.rank = bytearray(size)
+        self.sizes = array('l', [0]) * size
+        self.count = 0
+
+    def make_set(self, idx):
+        """ Adds idx as a set of one element, does nothing if idx is already in a set """
+        if self.parent[idx] != -1:
+            return
+        self.parent[idx] = idx
+        self.rank[idx] = 0
+        self.sizes[idx] = 1
+        self.count += 1
+
+    def union(self, i, j):
+        """
+        If elements are from different sets, performs union and returns 1.
+        Returns 0 if both elements are members of the same set.
+        """
+        root_i = self.find(i)
+        root_j = self.find(j)
+        if root_i == root_j:
+            return 0
+        if self.rank[root_i] < self.rank[root_j]:
+            root_i, root_j = root_j, root_i
+        elif self.rank[root_i] == self.rank[root_j]:
+            self.rank[root_i] += 1
+        self.parent[root_j] = root_i
+        self.sizes[root_i] += self.sizes[root_j]
+        self.count -= 1
+        return 1
+
+    def union_many(self, pairs):
+        """
+        Performs union for every (i, j) pair of an iterable or an (n, 2) array.
+        Returns the number of unions that merged two different sets.
+        Throws KeyError on the first pair with a key that was not added with make_set
+        """
+        if isinstance(pairs, np.ndarray):
+            pairs = pairs.tolist()
+        parent = self.parent
+        rank = self.rank
+        sizes = self.sizes
+        merged = 0
+        try:
+            for i, j in pairs:
+                if (i < 0) or (parent[i] == -1):
+                    raise KeyError(i)
+                if (j < 0) or (parent[j] == -1):
+                    raise KeyError(j)
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                while parent[j] != j:
+                    parent[j] = parent[parent[j]]
+                    j = parent[j]
+                if i == j:
+                    continue
+                if rank[i] < rank[j]:
+                    i, j = j, i
+                elif rank[i] == rank[j]:
+                    rank[i] += 1
+                parent[j] = i
+                sizes[i] += sizes[j]
+                merged += 1
+        finally:
+            # unions made before a missing key stay counted
+            self.count -= merged
+        return merged
+
+    def find(self, x):
+        """
+        Returns a key of the root of x, halving the path on the way.
+        Throws KeyError if x was not added with make_set, like UnionFind does
+        """
+        parent = self.parent
+        if (x < 0) or (parent[x] == -1):
+            raise KeyError(x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def size(self, x):
+        """ Returns the size of the set containing x """
+        return self.sizes[self.find(x)]
+
+    def component_count(self):
+        """ Returns the number of disjoint sets """
+        return self.count
+
+    def component_sizes(self):
+        """ Returns a dict where keys are roots of the sets and values are their sizes """
+        parent = np.frombuffer(self.parent, dtype='l')
+        roots = np.flatnonzero(parent == np.arange(len(parent)))
+        sizes = np.frombuffer(self.sizes, dtype='l')[roots]
+        return dict(zip(roots.tolist(), sizes.tolist()))
+
+
+def count_islands_streaming(rows):
+    """
+    Counts islands on a map consumed row by row from any iterable of rows,
+    e.g. lists, NumPy arrays or rows of a memory-mapped file.
+    Only labels of the previous row and a union-find over the runs of land
+    on the frontier are kept, so memory is O(ncols) instead of O(nrows*ncols).
+    Returns an integer -- number of islands on a map
+    """
+    counter = 0
+    n_frontier = 0
+    frontier = None
+    for row in rows:
+        row = np.asarray(row) != 0
+        # frontier components are keys 0..n_frontier-1, runs of this row follow them
+        labels, n_runs = _label_row(row, n_frontier)
+        runs_uf = ArrayUnionFind(n_frontier + n_runs)
+        for k in range(n_frontier + n_runs):
+            runs_uf.make_set(k)
+        if frontier is not None:
+            runs_uf.union_many(zip(*_seam_pairs(frontier, labels)))
+        roots = [runs_uf.find(k) for k in range(n_frontier + n_runs)]
+        # components that don't reach this row are finished islands
+        counter += len(set(roots[:n_frontier]).difference(roots[n_frontier:]))
+        relabel = {}
+        run_ids = [relabel.setdefault(root, len(relabel)) for root in roots[n_frontier:]]
+        frontier = np.full(len(row), -1, dtype=np.int64)
+        if n_runs:
+            frontier[row] = np.array(run_ids)[labels[row] - n_frontier]
+        n_frontier = len(relabel)
+    return counter + n_frontier
+
+
+def iter_npy_rows(path):
+    """ Yields rows of a 2-D map stored in a .npy file which is memory-mapped, not loaded """
+    grid = np.load(path, mmap_mode='r')
+    for i in range(grid.shape[0]):
+        yield grid[i]
+
+
+def iter_bitmap_rows(path, ncols, packed=True):
+    """
+    Yields rows of a map stored in a raw bitmap file which is memory-mapped, not loaded.
+    If packed, each row takes ceil(ncols / 8) bytes, one bit per cell starting
+    from the most significant bit, otherwise each row takes ncols bytes, one per cell.
+    Raises RuntimeError if the file does not consist of whole rows
+    """
+    size = os.path.getsize(path)
+    row_bytes = (ncols + 7) // 8 if packed else ncols
+    if size == 0:
+        return
+    if row_bytes == 0 or size % row_bytes:
+        raise RuntimeError('Bitmap file {0} of {1} bytes is not made of rows of {2} bytes'.format(
+            path, size, row_bytes))
+    bitmap = np.memmap(path, dtype=np.uint8, mode='r')
+    for i in range(len(bitmap) // row_bytes):
+        row = bitmap[i * row_bytes:(i + 1) * row_bytes]
+        if packed:
+            row = np.unpackbits(row)[:ncols]
+        yield row
+
+
+def _label_rows(rows):
+    """
+    Labels runs of land in consecutive rows and merges runs touching across rows.
+    Returns the number of islands, a flat parent array over run labels
+    and arrays with run labels of the first and the last rows
+    """
+    parent = array('l')
+    counter = 0
+    first_labels = prev_labels = None
+    for row in rows:
+        labels, n_runs = _label_row(np.asarray(row) != 0, len(parent))
+        parent.extend(range(len(parent), len(parent) + n_runs))
+        counter += n_runs
+        if prev_labels is None:
+            first_labels = labels
+        else:
+            for a, b in zip(*_seam_pairs(prev_labels, labels)):
+                root_a = _find_root(parent, a)
+                root_b = _find_root(parent, b)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+                    counter -= 1
+        prev_labels = labels
+    return counter, parent, first_labels, prev_labels
+
+
+def _label_tile(spec, row_from, row_to):
+    """
+    Worker function for count_islands_parallel: labels rows row_from..row_to-1
+    of a memory-mapped map described by spec = (path, offset, dtype, shape, order).
+    Returns the number of islands in the tile, the number of run labels used
+    and root labels (-1 for water) of the first and the last rows of the tile
+    """
+    path, offset, dtype, shape, order = spec
+    grid = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order=order)
+    counter, parent, first_labels, last_labels = _label_rows(
+        grid[i] for i in range(row_from, row_to))
+    edges = []
+    for labels in (first_labels, last_labels):
+        roots = labels.copy()
+        for col in np.flatnonzero(labels >= 0).tolist():
+            roots[col] = _find_root(parent, labels[col])
+        edges.append(roots)
+    return counter, len(parent), edges[0], edges[1]
+
+
+def count_islands_parallel(grid, n_workers=None, n_tiles=None, executor=None):
+    """
+    Counts islands splitting the map into horizontal tiles which are labelled
+    in a pool of processes, then merges islands along the seams of the tiles
+    with a UnionFind.
+
+    Input:
+        grid: 2-D NumPy array; a memory-mapped array (e.g. from np.load with
+              mmap_mode) is shared with the workers as is, other arrays are
+              written once to a temporary file that the workers map
+        n_workers: int, number of processes, defaults to the number of CPUs
+        n_tiles: int, number of tiles, defaults to 4 tiles per process
+        executor: concurrent.futures executor to reuse instead of starting a new pool
+    Output:
+        integer -- number of islands on a map
+    """
+    grid = np.asanyarray(grid)
+    if grid.ndim != 2 or grid.size == 0:
+        return 0
+    nrows = grid.shape[0]
+    n_workers = n_workers or os.cpu_count() or 1
+    n_tiles = max(1, min(nrows, n_tiles or 4 * n_workers))
+    bounds = [nrows * k // n_tiles for k in range(n_tiles + 1)]
+
+    tmp_path = None
+    if isinstance(grid, np.memmap) and isinstance(grid.base, mmap.mmap):
+        # a whole mapped file, not a view of it: workers can map the same file
+        order = 'F' if grid.flags.f_contiguous and not grid.flags.c_contiguous else 'C'
+        spec = (grid.filename, grid.offset, grid.dtype.str, grid.shape, order)
+    else:
+        fd, tmp_path = tempfile.mkstemp(suffix='.map')
+        os.close(fd)
+        np.ascontiguousarray(grid).tofile(tmp_path)
+        spec = (tmp_path, 0, grid.dtype.str, grid.shape, 'C')
+
+    try:
+        if executor is None:
+            with ProcessPoolExecutor(n_workers) as pool:
+                tiles = list(pool.map(_label_tile, [spec] * n_tiles, bounds[:-1], bounds[1:]))
+        else:
+            tiles = list(executor.map(_label_tile, [spec] * n_tiles, bounds[:-1], bounds[1:]))
+    finally:
+        if tmp_path is not None:
+            os.remove(tmp_path)
+
+    counter = 0
+    label_offset = 0
+    seams_uf = UnionFind()
+    prev_last = None
+    for tile_count, n_labels, first_roots, last_roots in tiles:
+        counter += tile_count
+        first_roots = np.where(first_roots >= 0, first_roots + label_offset, -1)
+        if prev_last is not None:
+            for a, b in zip(*_seam_pairs(prev_last, first_roots)):
+                for label in (a, b):
+                    if label not in seams_uf.uf_dict:
+                        seams_uf.make_set(label)
+                counter -= seams_uf.union(a, b)
+        prev_last = np.where(last_roots >= 0, last_roots + label_offset, -1)
+        label_offset += n_labels
+    return counter
+
+
 class IslandMap():
 
     def __init__(self, nrows, ncols, isl_array):
@@ -80,6 +397,84 @@ class IslandMap():
                             counter -= 1
         return counter
 
+    def countIslandsVectorized(self):
+        """
+        Counts islands labelling runs of land row by row with NumPy.
+        The map is viewed as a NumPy array (no copy if it already is one),
+        runs touching across adjacent rows are merged in a flat parent array.
+        Returns an integer -- number of islands on a map
+        """
+        grid = np.asarray(self.islands)
+        counter, _, _, _ = _label_rows(grid[i, :self.ncols] for i in range(self.nrows))
+        return counter
+
+    def countIslandsParallel(self, n_workers=None, n_tiles=None, executor=None):
+        """
+        Counts islands labelling horizontal tiles of the map in parallel processes
+        with count_islands_parallel. Returns an integer -- number of islands on a map
+        """
+        grid = np.asanyarray(self.islands)
+        if grid.shape != (self.nrows, self.ncols):
+            grid = grid[:self.nrows, :self.ncols]
+        return count_islands_parallel(grid, n_workers, n_tiles, executor)
+
+    def countIslandsStreaming(self):
+        """
+        Counts islands feeding the map row by row to count_islands_streaming.
+        Returns an integer -- number of islands on a map
+        """
+        return count_islands_streaming(self.islands[i] for i in range(self.nrows))
+
+    def iterIslands(self, connectivity=4):
+        """
+        Explores islands with an iterative depth-first search over an explicit stack,
+        so the size of an island is not limited by the recursion limit.
+        Unvisited land is kept in a flat bytearray which is cleared as cells are visited.
+        Yields (size, (min_row, min_col, max_row, max_col)) for every island as it is found
+        """
+        if connectivity == 4:
+            steps = ((0, 1), (1, 0), (0, -1), (-1, 0))
+        elif connectivity == 8:
+            steps = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+        else:
+            raise RuntimeError('Connectivity should be 4 or 8, got {0}'.format(connectivity))
+        nrows, ncols = self.nrows, self.ncols
+        if nrows * ncols == 0:
+            return
+        grid = np.asarray(self.islands)[:nrows, :ncols] != 0
+        land = bytearray(np.ascontiguousarray(grid).tobytes())
+        start = land.find(1)
+        while start != -1:
+            land[start] = 0
+            stack = [start]
+            size = 0
+            min_i = max_i = start // ncols
+            min_j = max_j = start % ncols
+            while stack:
+                i, j = divmod(stack.pop(), ncols)
+                size += 1
+                if i < min_i: min_i = i
+                if i > max_i: max_i = i
+                if j < min_j: min_j = j
+                if j > max_j: max_j = j
+                for di, dj in steps:
+                    new_i = i + di
+                    new_j = j + dj
+                    if (0 <= new_i < nrows) and (0 <= new_j < ncols):
+                        new_idx = new_i * ncols + new_j
+                        if land[new_idx]:
+                            land[new_idx] = 0
+                            stack.append(new_idx)
+            yield size, (min_i, min_j, max_i, max_j)
+            start = land.find(1, start + 1)
+
+    def countIslandsIterative(self, connectivity=4):
+        """
+        Counts islands using iterative Depth-First search (see iterIslands).
+        Returns an integer -- number of islands on a map
+        """
+        return sum(1 for island in self.iterIslands(connectivity))
+
     def countIslandsDFS(self, i, j, visited):
         """ Auxiliary recursive function for countIslandsRecursive """
         visited.add(i * self.ncols + j)
@@ -104,6 +499,97 @@ class IslandMap():
         return counter
 
 
+class IncrementalIslandMap(IslandMap):
+    """
+    Island map where water can be turned into land cell by cell.
+    Islands are kept in a persistent ArrayUnionFind, so the number of islands
+    is updated in amortized near-constant time per added cell, and cells of
+    every island are linked into a circular list for membership queries.
+    """
+
+    def __init__(self, nrows, ncols, isl_array=None):
+        if isl_array is None:
+            isl_array = [[0] * ncols for i in range(nrows)]
+        super().__init__(nrows, ncols, isl_array)
+        self.islands_uf = ArrayUnionFind(nrows * ncols)
+        self.next_cell = array('l', range(nrows * ncols))
+        grid = np.asarray(isl_array)
+        if grid.size:
+            for idx in np.flatnonzero(grid[:nrows, :ncols] != 0).tolist():
+                self.addLand(idx // ncols, idx % ncols)
+
+    def addLand(self, i, j):
+        """
+        Turns the cell (i, j) into land merging it with neighbouring islands.
+        Returns the number of islands on the map after the change
+        """
+        if not self.isInside(i, j):
+            raise IndexError('Cell ({0}, {1}) is outside of the map'.format(i, j))
+        uf = self.islands_uf
+        idx = i * self.ncols + j
+        if uf.parent[idx] != -1:
+            return uf.count
+        if not self.islands[i][j]:
+            self.islands[i][j] = 1
+        uf.make_set(idx)
+        for n_i, n_j in ((i-1, j), (i+1, j), (i, j-1), (i, j+1)):
+            if self.isInside(n_i, n_j):
+                n_idx = n_i * self.ncols + n_j
+                if (uf.parent[n_idx] != -1) and uf.union(idx, n_idx):
+                    # splice the circular lists of cells of both islands
+                    self.next_cell[idx], self.next_cell[n_idx] = \
+                        self.next_cell[n_idx], self.next_cell[idx]
+        return uf.count
+
+    def addLandBatch(self, cells):
+        """
+        Turns every (i, j) cell of an iterable into land.
+        Returns the number of islands on the map after the changes
+        """
+        for i, j in cells:
+            self.addLand(i, j)
+        return self.islands_uf.count
+
+    def isInside(self, i, j):
+        return (0 <= i < self.nrows) and (0 <= j < self.ncols)
+
+    def islandCount(self):
+        """ Returns the current number of islands without rescanning the map """
+        return self.islands_uf.count
+
+    def islandId(self, i, j):
+        """ Returns a key of the island containing the cell (i, j), -1 for water """
+        if not self.isInside(i, j):
+            raise IndexError('Cell ({0}, {1}) is outside of the map'.format(i, j))
+        idx = i * self.ncols + j
+        if self.islands_uf.parent[idx] == -1:
+            return -1
+        return self.islands_uf.find(idx)
+
+    def islandSize(self, i, j):
+        """ Returns the number of cells of the island containing the cell (i, j), 0 for water """
+        if not self.isInside(i, j):
+            raise IndexError('Cell ({0}, {1}) is outside of the map'.format(i, j))
+        idx = i * self.ncols + j
+        if self.islands_uf.parent[idx] == -1:
+            return 0
+        return self.islands_uf.size(idx)
+
+    def islandCells(self, i, j):
+        """ Returns a list of (row, col) cells of the island containing the cell (i, j) """
+        if not self.isInside(i, j):
+            raise IndexError('Cell ({0}, {1}) is outside of the map'.format(i, j))
+        start = i * self.ncols + j
+        if self.islands_uf.parent[start] == -1:
+            return []
+        cells = [(i, j)]
+        idx = self.next_cell[start]
+        while idx != start:
+            cells.append(divmod(idx, self.ncols))
+            idx = self.next_cell[idx]
+        return cells
+
+
 class TestCountIslands(unittest.TestCase):
 
     def test_empty_case(self):
@@ -111,6 +597,8 @@ class TestCountIslands(unittest.TestCase):
         im = IslandMap(3, 3, isl_map)
         self.assertEqual(im.countIslands(), 0)
         self.assertEqual(im.countIslandsRecursive(), 0)
+        self.assertEqual(im.countIslandsVectorized(), 0)
+        self.assertEqual(im.countIslandsStreaming(), 0)
     
     def test_full_case(self):
         isl_map = [[1,1,1],[1,1,1],[1,1,1]]
@@ -147,6 +635,7 @@ class TestCountIslands(unittest.TestCase):
         im = IslandMap(6, 12, isl_map)
         self.assertEqual(im.countIslands(), 5)
         self.assertEqual(im.countIslandsRecursive(), 5)
+        self.assertEqual(im.countIslandsVectorized(), 5)
 
     def test_doughnut_in_doughnut(self):
         isl_map = [
@@ -160,6 +649,7 @@ class TestCountIslands(unittest.TestCase):
         im = IslandMap(7, 12, isl_map)
         self.assertEqual(im.countIslands(), 2)
         self.assertEqual(im.countIslandsRecursive(), 2)
+        self.assertEqual(im.countIslandsVectorized(), 2)
 
     def test_random_matrices(self):
         for i in range(50):
@@ -171,6 +661,260 @@ class TestCountIslands(unittest.TestCase):
                     isl_map = np.random.binomial(1, prob, size=mat_size)
                     im = IslandMap(mat_size[0], mat_size[1], isl_map)
                     self.assertEqual(im.countIslands(), im.countIslandsRecursive())
+                    self.assertEqual(im.countIslandsVectorized(), im.countIslandsRecursive())
+                    self.assertEqual(im.countIslandsStreaming(), im.countIslandsRecursive())
+                    self.assertEqual(im.countIslandsIterative(), im.countIslandsRecursive())
+
+    def test_vectorized_empty_map(self):
+        im = IslandMap(0, 0, [])
+        self.assertEqual(im.countIslandsVectorized(), 0)
+        im = IslandMap(2, 0, [[], []])
+        self.assertEqual(im.countIslandsVectorized(), 0)
+
+    def test_vectorized_comb(self):
+        # teeth of the comb are joined only at the bottom row
+        isl_map = np.zeros((50, 51), dtype=np.int8)
+        isl_map[:, ::2] = 1
+        isl_map[-1, :] = 1
+        im = IslandMap(50, 51, isl_map)
+        self.assertEqual(im.countIslandsVectorized(), 1)
+        isl_map[-1, :] = 0
+        self.assertEqual(im.countIslandsVectorized(), 26)
+
+    def test_streaming_u_shapes(self):
+        # arms of the U shapes are separate islands until the last row joins them
+        isl_map = [
+            [1,0,1,0,1,0,1],
+            [1,0,1,0,1,0,1],
+            [1,1,1,0,1,1,1],
+            [0,0,0,0,0,0,0],
+            [1,0,1,0,1,0,1],
+            [1,1,1,1,1,1,1]]
+        self.assertEqual(count_islands_streaming(iter(isl_map)), 3)
+        self.assertEqual(count_islands_streaming([]), 0)
+
+    def test_streaming_files(self):
+        np.random.seed(0)
+        isl_map = np.random.binomial(1, 0.5, size=(30, 21)).astype(np.uint8)
+        expected = IslandMap(30, 21, isl_map).countIslands()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            npy_path = os.path.join(tmp_dir, 'map.npy')
+            np.save(npy_path, isl_map)
+            self.assertEqual(count_islands_streaming(iter_npy_rows(npy_path)), expected)
+            raw_path = os.path.join(tmp_dir, 'map.raw')
+            isl_map.tofile(raw_path)
+            self.assertEqual(count_islands_streaming(
+                iter_bitmap_rows(raw_path, 21, packed=False)), expected)
+            bits_path = os.path.join(tmp_dir, 'map.bits')
+            np.packbits(isl_map, axis=1).tofile(bits_path)
+            self.assertEqual(count_islands_streaming(iter_bitmap_rows(bits_path, 21)), expected)
+
+    def test_bitmap_partial_rows(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'map.raw')
+            with open(path, 'wb') as f:
+                f.write(bytes(10))
+            self.assertEqual(len(list(iter_bitmap_rows(path, 5, packed=False))), 2)
+            self.assertEqual(len(list(iter_bitmap_rows(path, 33))), 2)
+            with self.assertRaises(RuntimeError):
+                list(iter_bitmap_rows(path, 3, packed=False))
+            with self.assertRaises(RuntimeError):
+                list(iter_bitmap_rows(path, 25))
+            with self.assertRaises(RuntimeError):
+                list(iter_bitmap_rows(path, 0))
+            open(path, 'wb').close()
+            self.assertEqual(list(iter_bitmap_rows(path, 0)), [])
+
+    def test_parallel_random_matrices(self):
+        with ProcessPoolExecutor(2) as executor:
+            for i in range(50):
+                np.random.seed(i)
+                sizes = [(5, 5), (10, 10), (20, 20)]
+                probs = [0.2, 0.5, 0.8]
+                for mat_size in sizes:
+                    for prob in probs:
+                        isl_map = np.random.binomial(1, prob, size=mat_size)
+                        im = IslandMap(mat_size[0], mat_size[1], isl_map)
+                        self.assertEqual(im.countIslandsParallel(n_tiles=4, executor=executor),
+                            im.countIslandsRecursive())
+
+    def test_parallel_memmap(self):
+        np.random.seed(0)
+        isl_map = np.random.binomial(1, 0.6, size=(40, 25)).astype(np.uint8)
+        expected = IslandMap(40, 25, isl_map).countIslands()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for order in ('C', 'F'):
+                npy_path = os.path.join(tmp_dir, 'map_{0}.npy'.format(order))
+                np.save(npy_path, np.asarray(isl_map, order=order))
+                mapped = np.load(npy_path, mmap_mode='r')
+                self.assertEqual(count_islands_parallel(mapped, n_workers=2, n_tiles=7), expected)
+                self.assertEqual(count_islands_parallel(mapped[5:], n_workers=2, n_tiles=3),
+                    IslandMap(35, 25, isl_map[5:]).countIslands())
+                del mapped
+
+    def test_iterative_island_stats(self):
+        isl_map = [
+            [1,1,0,0,1],
+            [0,1,0,1,0],
+            [0,0,0,0,0],
+            [1,0,0,1,1]]
+        im = IslandMap(4, 5, isl_map)
+        self.assertEqual(sorted(im.iterIslands()),
+            [(1, (0, 4, 0, 4)), (1, (1, 3, 1, 3)), (1, (3, 0, 3, 0)),
+             (2, (3, 3, 3, 4)), (3, (0, 0, 1, 1))])
+        self.assertEqual(sorted(im.iterIslands(connectivity=8)),
+            [(1, (3, 0, 3, 0)), (2, (0, 3, 1, 4)), (2, (3, 3, 3, 4)), (3, (0, 0, 1, 1))])
+        self.assertEqual(im.countIslandsIterative(connectivity=8), 4)
+        with self.assertRaises(RuntimeError):
+            im.countIslandsIterative(connectivity=6)
+        self.assertEqual(IslandMap(0, 0, []).countIslandsIterative(), 0)
+
+    def test_iterative_large_island(self):
+        # a snake-shaped island much longer than the recursion limit
+        isl_map = np.zeros((301, 300), dtype=np.int8)
+        isl_map[::2, :] = 1
+        isl_map[1::4, -1] = 1
+        isl_map[3::4, 0] = 1
+        im = IslandMap(301, 300, isl_map)
+        self.assertEqual(list(im.iterIslands()), [(151 * 300 + 150, (0, 0, 300, 299))])
+
+
+class TestIncrementalIslandMap(unittest.TestCase):
+
+    def test_addLand(self):
+        im = IncrementalIslandMap(3, 3)
+        self.assertEqual(im.islandCount(), 0)
+        self.assertEqual(im.addLand(0, 0), 1)
+        self.assertEqual(im.addLand(0, 2), 2)
+        self.assertEqual(im.addLand(0, 2), 2)
+        self.assertEqual(im.addLand(2, 0), 3)
+        self.assertEqual(im.addLand(0, 1), 2)
+        self.assertEqual(im.islandSize(0, 0), 3)
+        self.assertEqual(sorted(im.islandCells(0, 2)), [(0, 0), (0, 1), (0, 2)])
+        self.assertEqual(im.islandId(0, 0), im.islandId(0, 2))
+        self.assertEqual(im.islandId(1, 1), -1)
+        self.assertEqual(im.islandSize(1, 1), 0)
+        self.assertEqual(im.islandCells(1, 1), [])
+        self.assertEqual(im.addLandBatch([(1, 0), (1, 1)]), 1)
+        self.assertEqual(im.islandSize(2, 0), 6)
+        self.assertEqual(im.countIslands(), 1)
+        with self.assertRaises(IndexError):
+            im.addLand(3, 0)
+
+    def test_outside_cells(self):
+        im = IncrementalIslandMap(3, 3)
+        im.addLand(2, 2)
+        for i, j in ((0, -1), (-1, 0), (3, 0), (0, 3)):
+            with self.assertRaises(IndexError):
+                im.islandId(i, j)
+            with self.assertRaises(IndexError):
+                im.islandSize(i, j)
+            with self.assertRaises(IndexError):
+                im.islandCells(i, j)
+        self.assertEqual(im.islandCells(2, 2), [(2, 2)])
+
+    def test_existing_map(self):
+        isl_map = [[1,0,1],[0,0,0],[1,1,1]]
+        im = IncrementalIslandMap(3, 3, isl_map)
+        self.assertEqual(im.islandCount(), 3)
+        self.assertEqual(im.addLand(1, 2), 2)
+        self.assertEqual(sorted(im.islandCells(0, 2)), [(0, 2), (1, 2), (2, 0), (2, 1), (2, 2)])
+        self.assertEqual(isl_map[1][2], 1)
+
+    def test_random_additions(self):
+        np.random.seed(0)
+        isl_map = np.zeros((15, 15), dtype=np.int8)
+        im = IncrementalIslandMap(15, 15, isl_map)
+        for idx in np.random.permutation(225)[:150].tolist():
+            count = im.addLand(idx // 15, idx % 15)
+            self.assertEqual(count, IslandMap(15, 15, isl_map).countIslandsRecursive())
+        sizes = {}
+        for i in range(15):
+            for j in range(15):
+                if isl_map[i][j]:
+                    sizes[im.islandId(i, j)] = im.islandSize(i, j)
+                    self.assertEqual(len(im.islandCells(i, j)), im.islandSize(i, j))
+        self.assertEqual(sum(sizes.values()), 150)
+
+
+class TestArrayUnionFind(unittest.TestCase):
+
+    def test_simple(self):
+        uf = ArrayUnionFind(6)
+        for i in range(5):
+            uf.make_set(i)
+        self.assertEqual(uf.component_count(), 5)
+        self.assertEqual(uf.union(0, 1), 1)
+        self.assertEqual(uf.union(1, 0), 0)
+        self.assertEqual(uf.union(2, 3), 1)
+        self.assertEqual(uf.union(3, 1), 1)
+        self.assertEqual(uf.find(0), uf.find(2))
+        self.assertNotEqual(uf.find(0), uf.find(4))
+        self.assertEqual(uf.component_count(), 2)
+        self.assertEqual(sorted(uf.component_sizes().values()), [1, 4])
+
+    def test_union_many(self):
+        uf = ArrayUnionFind(5)
+        for i in range(5):
+            uf.make_set(i)
+        self.assertEqual(uf.union_many([(0, 1), (1, 2), (2, 0), (3, 4)]), 3)
+        self.assertEqual(uf.union_many(np.array([[0, 4], [1, 3]])), 1)
+        self.assertEqual(uf.component_count(), 1)
+        self.assertEqual(uf.component_sizes(), {uf.find(0): 5})
+
+    def test_missing_keys(self):
+        uf = ArrayUnionFind(3)
+        uf.make_set(0)
+        with self.assertRaises(KeyError):
+            uf.find(1)
+        with self.assertRaises(KeyError):
+            uf.find(-1)
+        with self.assertRaises(KeyError):
+            uf.union(0, 1)
+        with self.assertRaises(KeyError):
+            uf.size(2)
+        self.assertEqual(uf.component_count(), 1)
+        self.assertEqual(list(uf.parent), [0, -1, -1])
+
+        uf.make_set(1)
+        with self.assertRaises(KeyError):
+            uf.union_many([(0, 1), (1, 2)])
+        # the union before the missing key is kept and counted
+        self.assertEqual(uf.component_count(), 1)
+        self.assertEqual(uf.find(0), uf.find(1))
+        self.assertEqual(uf.parent[2], -1)
+
+    def test_repeated_make_set(self):
+        uf = ArrayUnionFind(3)
+        for i in range(3):
+            uf.make_set(i)
+        uf.union(0, 1)
+        uf.union(1, 2)
+        for i in range(3):
+            uf.make_set(i)
+        self.assertEqual(uf.component_count(), 1)
+        self.assertEqual(uf.size(1), 3)
+        self.assertEqual(sum(uf.component_sizes().values()), 3)
+        self.assertEqual(uf.find(0), uf.find(2))
+
+    def test_random_unions(self):
+        np.random.seed(0)
+        pairs = np.random.randint(0, 200, size=(150, 2))
+        uf = UnionFind()
+        auf = ArrayUnionFind(200)
+        for i in range(200):
+            uf.make_set(i)
+            auf.make_set(i)
+        merged = sum(uf.union(i, j) for i, j in pairs.tolist())
+        self.assertEqual(auf.union_many(pairs), merged)
+        self.assertEqual(auf.component_count(), 200 - merged)
+        groups, array_groups = {}, {}
+        for i in range(200):
+            groups.setdefault(uf.find(i), set()).add(i)
+            array_groups.setdefault(auf.find(i), set()).add(i)
+        self.assertEqual(sorted(map(sorted, groups.values())),
+            sorted(map(sorted, array_groups.values())))
+
 
 if __name__ == '__main__':
     unittest.main()
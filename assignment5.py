@@ -1,7 +1,20 @@
 #!/usr/bin/env python3
+import heapq
+import os
+import random
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
+class GraphCycleError(RuntimeError):
+    """ Raised when a topological order is requested for a graph with cycles """
+
+    def __init__(self, vertices):
+        super().__init__('The graph has cycles through the vertices: {0}'.format(
+            ', '.join(sorted(str(v) for v in vertices))))
+        self.vertices = vertices
+
+
 class Graph():
 
     def __init__(self):
@@ -33,6 +46,136 @@ class Graph():
         sorted_list.reverse()
         return sorted_list
 
+    def top_sort_kahn(self, lexicographic=False):
+        """ 
+        Topological sorting removing vertices without incoming edges (Kahn's algorithm).
+        Runs in O(V+E) without recursion. If lexicographic is True, the smallest of
+        the available vertices is taken each time, so the order is the lexicographically
+        smallest one; this takes O((V+E) log V).
+
+        Raises GraphCycleError with the vertices on cycles if the graph is not a DAG
+        """
+        in_degree = self._in_degrees()
+        ready = [v for v, degree in in_degree.items() if degree == 0]
+        if lexicographic:
+            heapq.heapify(ready)
+        sorted_list = []
+        while ready:
+            point = heapq.heappop(ready) if lexicographic else ready.pop()
+            sorted_list.append(point)
+            for next_point in self.edges.get(point, ()):
+                in_degree[next_point] -= 1
+                if in_degree[next_point] == 0:
+                    if lexicographic:
+                        heapq.heappush(ready, next_point)
+                    else:
+                        ready.append(next_point)
+        if len(sorted_list) < len(in_degree):
+            raise GraphCycleError(self._cycle_vertices(
+                set(v for v, degree in in_degree.items() if degree > 0)))
+        return sorted_list
+
+    def top_layers(self):
+        """ 
+        Splits vertices into layers: every layer holds the vertices whose predecessors
+        are all in the earlier layers, so vertices of one layer are independent of
+        each other and can be processed concurrently. The number of layers is
+        the number of vertices on the critical (longest) path. Runs in O(V+E).
+
+        Raises GraphCycleError with the vertices on cycles if the graph is not a DAG
+        """
+        return self._kahn_layers()[0]
+
+    def critical_path(self):
+        """ 
+        Returns vertices of a longest path of the graph, one from each layer of top_layers.
+        Raises GraphCycleError with the vertices on cycles if the graph is not a DAG
+        """
+        layers, ready_after = self._kahn_layers()
+        if not layers:
+            return []
+        path = [layers[-1][0]]
+        while path[-1] in ready_after:
+            path.append(ready_after[path[-1]])
+        path.reverse()
+        return path
+
+    def _in_degrees(self):
+        """ Returns a dict with the number of incoming edges of every vertex """
+        in_degree = dict.fromkeys(self.v_sources | self.v_stocks, 0)
+        for targets in self.edges.values():
+            for v in targets:
+                in_degree[v] += 1
+        return in_degree
+
+    def _kahn_layers(self):
+        """ 
+        Kahn's algorithm removing whole layers of vertices without incoming edges.
+        Returns the layers and a dict vertex -> predecessor which was removed last
+        (it lies in the previous layer)
+        """
+        in_degree = self._in_degrees()
+        layer = [v for v, degree in in_degree.items() if degree == 0]
+        layers = []
+        ready_after = {}
+        n_sorted = 0
+        while layer:
+            layers.append(layer)
+            n_sorted += len(layer)
+            next_layer = []
+            for point in layer:
+                for next_point in self.edges.get(point, ()):
+                    in_degree[next_point] -= 1
+                    if in_degree[next_point] == 0:
+                        ready_after[next_point] = point
+                        next_layer.append(next_point)
+            layer = next_layer
+        if n_sorted < len(in_degree):
+            raise GraphCycleError(self._cycle_vertices(
+                set(v for v, degree in in_degree.items() if degree > 0)))
+        return layers, ready_after
+
+    def _cycle_vertices(self, remaining):
+        """ 
+        Given the vertices left after Kahn's algorithm, drops the ones that only lead
+        out of cycles and returns the rest: vertices on cycles or between them
+        """
+        out_degree = dict.fromkeys(remaining, 0)
+        predecessors = {}
+        for v in remaining:
+            for next_point in self.edges.get(v, ()):
+                if next_point in remaining:
+                    out_degree[v] += 1
+                    predecessors.setdefault(next_point, []).append(v)
+        sinks = [v for v, degree in out_degree.items() if degree == 0]
+        while sinks:
+            point = sinks.pop()
+            remaining.discard(point)
+            for prev_point in predecessors.get(point, ()):
+                out_degree[prev_point] -= 1
+                if out_degree[prev_point] == 0:
+                    sinks.append(prev_point)
+        return remaining
+
+    def compile(self):
+        """ 
+        Builds a read-only CompiledGraph with vertices interned to integers
+        (in sorted order, if vertices can be compared) and edges in CSR arrays
+        """
+        vertices = list(self.v_sources | self.v_stocks)
+        try:
+            vertices.sort()
+        except TypeError:
+            pass
+        index = {v: k for k, v in enumerate(vertices)}
+        dtype = np.int32 if len(vertices) < 2**31 else np.int64
+        lengths = np.fromiter((len(self.edges.get(v, ())) for v in vertices), np.int64, len(vertices))
+        offsets = np.zeros(len(vertices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        targets = np.fromiter((index[v_to] for v in vertices for v_to in self.edges.get(v, ())),
+            dtype, int(offsets[-1]))
+        return CompiledGraph(vertices, offsets, targets, index)
+
     def top_sort_recursive(self, point, v_starts, v_visited, sorted_list):
         """ Auxiliary recursive function for Topological Sorting """
         v_starts.discard(point)
@@ -44,6 +187,150 @@ class Graph():
         sorted_list.append(point)
 
 
+def _csr_successors(offsets, targets, frontier):
+    """ Returns targets of all edges going out of the vertices of frontier array """
+    starts = offsets[frontier]
+    lengths = offsets[frontier + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return targets[:0]
+    # positions of the edges: starts[k], starts[k]+1, ... for every frontier vertex k
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return targets[np.arange(total) + shifts]
+
+
+class CompiledGraph():
+    """ 
+    Read-only form of a Graph where vertices are interned to integers 0..n-1
+    and edges are stored in compressed sparse row (CSR) arrays: targets of
+    the vertex k are targets[offsets[k]:offsets[k+1]]. Traversals process
+    whole frontiers of vertices at once with NumPy, frontiers of at most
+    scalar_frontier_size vertices are processed vertex by vertex
+    """
+
+    def __init__(self, vertices, offsets, targets, index=None):
+        self.vertices = vertices
+        self.index = index if index is not None else {v: k for k, v in enumerate(vertices)}
+        self.offsets = offsets
+        self.targets = targets
+        # frontiers of traversals up to this size are processed without NumPy
+        self.scalar_frontier_size = 64
+
+    def successors(self, v):
+        k = self.index[v]
+        return [self.vertices[t] for t in self.targets[self.offsets[k]:self.offsets[k+1]].tolist()]
+
+    def top_sort(self):
+        """ 
+        Topological sorting removing all vertices without incoming edges at once,
+        frontier by frontier (Kahn's algorithm), without recursion. Narrow frontiers
+        are processed vertex by vertex in O(V+E); frontiers wider than
+        scalar_frontier_size are processed with NumPy, where np.unique sorts
+        their successors, so the worst case is O(V + E log E).
+
+        Raises GraphCycleError with the vertices on cycles if the graph is not a DAG
+        """
+        order = []
+        for frontier in self._kahn_frontiers():
+            order.extend(frontier)
+        return [self.vertices[k] for k in order]
+
+    def top_layers(self):
+        """ 
+        Same as Graph.top_layers: the frontiers of vertices removed at once by top_sort,
+        every frontier in the order of vertex numbers.
+        Raises GraphCycleError with the vertices on cycles if the graph is not a DAG
+        """
+        return [[self.vertices[k] for k in frontier] for frontier in self._kahn_frontiers()]
+
+    def _kahn_frontiers(self):
+        """ 
+        Yields the frontiers of Kahn's algorithm as sorted lists of vertex numbers.
+        Raises GraphCycleError in the end if some vertices are left
+        """
+        n = len(self.vertices)
+        in_degree = np.bincount(self.targets, minlength=n)
+        # fast access to single items of the same buffers for narrow frontiers
+        degree = memoryview(in_degree)
+        offsets, targets = memoryview(self.offsets), memoryview(self.targets)
+        frontier = np.flatnonzero(in_degree == 0).tolist()
+        n_sorted = 0
+        while frontier:
+            yield frontier
+            n_sorted += len(frontier)
+            if len(frontier) <= self.scalar_frontier_size:
+                next_frontier = []
+                for k in frontier:
+                    for t in targets[offsets[k]:offsets[k+1]]:
+                        degree[t] -= 1
+                        if degree[t] == 0:
+                            next_frontier.append(t)
+                if len(next_frontier) > 1:
+                    next_frontier.sort()
+                frontier = next_frontier
+            else:
+                succ, counts = np.unique(_csr_successors(self.offsets, self.targets, np.array(frontier)),
+                    return_counts=True)
+                in_degree[succ] -= counts
+                frontier = succ[in_degree[succ] == 0].tolist()
+        if n_sorted < n:
+            # vertices that were never freed keep incoming edges
+            raise GraphCycleError(self._cycle_vertices(in_degree > 0))
+
+    def _cycle_vertices(self, remaining):
+        """ 
+        Given a mask of the vertices left after Kahn's algorithm, drops the ones that
+        only lead out of cycles and returns the rest: vertices on cycles or between them
+        """
+        sources = np.repeat(np.arange(len(self.vertices)), np.diff(self.offsets))
+        inner = remaining[sources] & remaining[self.targets]
+        sources, targets = sources[inner], self.targets[inner]
+        out_degree = np.bincount(sources, minlength=len(self.vertices))
+        # reversed CSR of the remaining edges
+        order = np.argsort(targets, kind='stable')
+        rev_targets = sources[order]
+        rev_offsets = np.zeros(len(self.vertices) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=len(self.vertices)), out=rev_offsets[1:])
+        frontier = np.flatnonzero(remaining & (out_degree == 0))
+        while len(frontier):
+            remaining[frontier] = False
+            pred, counts = np.unique(_csr_successors(rev_offsets, rev_targets, frontier),
+                return_counts=True)
+            out_degree[pred] -= counts
+            frontier = pred[out_degree[pred] == 0]
+        return set(self.vertices[k] for k in np.flatnonzero(remaining).tolist())
+
+    def bfs(self, start):
+        """ 
+        Returns vertices reachable from start in Breadth-First search order.
+        Like top_sort, processes narrow frontiers vertex by vertex and wide ones with NumPy
+        """
+        visited = np.zeros(len(self.vertices), dtype=bool)
+        seen = memoryview(visited)
+        offsets, targets = memoryview(self.offsets), memoryview(self.targets)
+        frontier = [self.index[start]]
+        visited[frontier] = True
+        order = []
+        while frontier:
+            order.extend(frontier)
+            if len(frontier) <= self.scalar_frontier_size:
+                succ = []
+                for k in frontier:
+                    for t in targets[offsets[k]:offsets[k+1]]:
+                        if not seen[t]:
+                            seen[t] = True
+                            succ.append(t)
+                frontier = succ
+                continue
+            succ = _csr_successors(self.offsets, self.targets, np.array(frontier))
+            # keep the first occurrence of every new vertex in edge order
+            succ = succ[~visited[succ]]
+            succ = succ[np.sort(np.unique(succ, return_index=True)[1])]
+            visited[succ] = True
+            frontier = succ.tolist()
+        return [self.vertices[k] for k in order]
+
+
 def first_uncommon_letter(str1, str2):
     """ 
     Returns an index of the first letter that is different in two strings, -1 if not found
@@ -77,6 +364,157 @@ def parse_alphabet(words):
     return letters.top_sort()
 
 
+def extract_letter_orders(words):
+    """ 
+    Returns the set of letters of the words and the set of (letter, letter) orders
+    defined by adjacent words of a list of words in lexicographic order
+    """
+    letters = set()
+    orders = set()
+    for word in words:
+        letters.update(word)
+    for i in range(len(words) - 1):
+        if words[i] and words[i+1]:
+            let_idx = first_uncommon_letter(words[i], words[i+1])
+            if let_idx != -1:
+                orders.add((words[i][let_idx], words[i+1][let_idx]))
+    return letters, orders
+
+
+def extract_letter_orders_numpy(words):
+    """ 
+    Same as extract_letter_orders, but all adjacent words are compared at once
+    as rows of a fixed-width NumPy array of code points padded with zeros.
+    Meant for short words, the array takes 4 * len(words) * max word length bytes.
+    Words should not contain '\0'
+    """
+    if not words:
+        return set(), set()
+    codes = np.array(words, dtype='U')
+    codes = codes.view(np.uint32).reshape(len(words), codes.itemsize // 4)
+    letters = set(chr(c) for c in np.unique(codes).tolist() if c)
+    diff = codes[:-1] != codes[1:]
+    rows = np.flatnonzero(diff.any(axis=1))
+    let_idx = diff[rows].argmax(axis=1)
+    lets_from = codes[rows, let_idx]
+    lets_to = codes[rows + 1, let_idx]
+    # zero padding in a pair means that one word is a prefix of another
+    valid = (lets_from != 0) & (lets_to != 0)
+    pairs = np.unique(np.stack([lets_from[valid], lets_to[valid]], axis=1), axis=0)
+    return letters, set((chr(a), chr(b)) for a, b in pairs.tolist())
+
+
+NUMPY_MAX_WORD_LEN = 16
+
+
+def _extract_chunk(chunk):
+    """ Worker function for parse_alphabet_parallel """
+    if max((len(word) for word in chunk), default=0) <= NUMPY_MAX_WORD_LEN:
+        return extract_letter_orders_numpy(chunk)
+    return extract_letter_orders(chunk)
+
+
+def parse_alphabet_parallel(words, n_workers=None, chunk_size=None):
+    """
+    Same as parse_alphabet, but letter orders are extracted from chunks of words
+    in a pool of processes. Chunks overlap by one word, so every adjacent pair is
+    compared once. Chunks of short words are compared with NumPy.
+    The deduplicated orders are merged and sorted once.
+    Raises GraphCycleError if the words are not consistent with any alphabet
+
+    Input:
+        words: List of Strings, words in lexicographic order
+        n_workers: int, number of processes, defaults to the number of CPUs
+        chunk_size: int, number of adjacent pairs per chunk, defaults to 4 chunks per process
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, len(words) // (4 * n_workers))
+    chunks = [words[start:start + chunk_size + 1]
+        for start in range(0, max(1, len(words) - 1), chunk_size)]
+    letters = Graph()
+    with ProcessPoolExecutor(n_workers) as pool:
+        for chunk_letters, chunk_orders in pool.map(_extract_chunk, chunks):
+            for l in chunk_letters:
+                letters.add_vertex(l)
+            for let_from, let_to in chunk_orders:
+                letters.add_edge(let_from, let_to)
+    return letters.top_sort_kahn()
+
+
+class AlphabetInferer():
+    """ 
+    Infers an alphabet from words in lexicographic order which arrive in batches.
+    Only adjacent words are compared as they arrive, repeated letter orders are
+    stored once, and the order of letters is updated incrementally after every
+    new letter order (Pearce-Kelly dynamic topological sort) instead of sorting
+    the whole graph again
+    """
+
+    def __init__(self):
+        self.successors = {} # letter -> set of letters that come right after it
+        self.predecessors = {} # letter -> set of letters that come right before it
+        self.position = {} # letter -> position in the current alphabet
+        self.last_word = None
+
+    def feed(self, words):
+        """ 
+        Consumes words from any iterable (e.g. a generator over lines of a file),
+        continuing from the last word of the previous batch. Returns the current alphabet.
+        Raises GraphCycleError if the words contradict the orders seen so far
+        """
+        for word in words:
+            for l in word:
+                self.add_letter(l)
+            prev_word = self.last_word
+            self.last_word = word
+            if prev_word:
+                let_idx = first_uncommon_letter(prev_word, word) if word else -1
+                if let_idx != -1:
+                    self.add_order(prev_word[let_idx], word[let_idx])
+        return self.alphabet()
+
+    def alphabet(self):
+        """ Returns a list of the letters seen so far in an order consistent with the words """
+        return sorted(self.position, key=self.position.get)
+
+    def add_letter(self, l):
+        if l not in self.position:
+            self.position[l] = len(self.position)
+            self.successors[l] = set()
+            self.predecessors[l] = set()
+
+    def add_order(self, let_from, let_to):
+        """ Adds the order let_from < let_to, moving letters in the current alphabet if needed """
+        if let_to in self.successors[let_from]:
+            return
+        position = self.position
+        lower, upper = position[let_to], position[let_from]
+        if lower < upper:
+            # letters reachable from let_to and placed before let_from have to move after it
+            forward = self._reach(let_to, self.successors, lambda l: position[l] <= upper)
+            if let_from in forward:
+                backward = self._reach(let_from, self.predecessors, lambda l: True)
+                raise GraphCycleError(forward & self._reach(let_to, self.successors,
+                    lambda l: l in backward))
+            backward = self._reach(let_from, self.predecessors, lambda l: position[l] >= lower)
+            moved = sorted(backward, key=position.get) + sorted(forward, key=position.get)
+            for l, pos in zip(moved, sorted(position[l] for l in moved)):
+                position[l] = pos
+        self.successors[let_from].add(let_to)
+        self.predecessors[let_to].add(let_from)
+
+    def _reach(self, start, neighbours, allowed):
+        """ Returns the set of letters reachable from start through allowed letters """
+        reached = {start}
+        stack = [start]
+        while stack:
+            for l in neighbours[stack.pop()]:
+                if (l not in reached) and allowed(l):
+                    reached.add(l)
+                    stack.append(l)
+        return reached
+
+
 class TestAlphabet(unittest.TestCase):
 
     def check_order(self, alphabet, let1, let2):
@@ -146,5 +584,190 @@ class TestAlphabet(unittest.TestCase):
         self.assertEqual(set(['A', 'B', 'C']), set(alphabet))
 
 
+    def test_parallel(self):
+        words = ['A', 'B', 'C', 'CD', 'CE', 'FG', 'FH']
+        letters_order = [['A','B'],['B','C'],['C','F'],['D','E'],['G','H']]
+        for chunk_size in (None, 1, 2, 10):
+            alphabet = parse_alphabet_parallel(words, n_workers=2, chunk_size=chunk_size)
+            self.assertEqual(len(alphabet), 8)
+            self.assertTrue(self.check_unique(alphabet))
+            for rel in letters_order:
+                self.assertTrue(self.check_order(alphabet, rel[0], rel[1]))
+        self.assertEqual(sorted(parse_alphabet_parallel(['ABC'], n_workers=2)), ['A', 'B', 'C'])
+        self.assertEqual(parse_alphabet_parallel([], n_workers=2), [])
+        long_words = ['A' * 20 + 'B', 'A' * 20 + 'C', 'B']
+        self.assertEqual(parse_alphabet_parallel(long_words, n_workers=2), ['A', 'B', 'C'])
+        with self.assertRaises(GraphCycleError):
+            parse_alphabet_parallel(['AB', 'B', 'A'], n_workers=2)
+
+    def test_extract_numpy(self):
+        random.seed(0)
+        for k in range(20):
+            words = [''.join(random.choice('ABCD') for i in range(random.randint(0, 4)))
+                for w in range(30)]
+            self.assertEqual(extract_letter_orders_numpy(words), extract_letter_orders(words))
+        self.assertEqual(extract_letter_orders_numpy([]), (set(), set()))
+        self.assertEqual(extract_letter_orders_numpy(['', '']), (set(), set()))
+
+    def test_inferer_batches(self):
+        inferer = AlphabetInferer()
+        self.assertEqual(inferer.feed([]), [])
+        self.assertEqual(inferer.feed(['BA', 'BC']), ['B', 'A', 'C'])
+        self.assertEqual(inferer.feed(['C']), ['B', 'A', 'C'])
+        # A < B contradicts the current alphabet, so A has to move before B
+        self.assertEqual(inferer.feed(iter(['CA', 'CA', 'CB'])), ['A', 'B', 'C'])
+        self.assertEqual(inferer.feed(['CBA', 'CBC', 'CC']), ['A', 'B', 'C'])
+        self.assertEqual(inferer.successors, {'A': {'B', 'C'}, 'B': {'C'}, 'C': set()})
+
+    def test_inferer_random(self):
+        random.seed(0)
+        for k in range(20):
+            order = random.sample('ABCDEFGHIJ', 10)
+            words = sorted((''.join(random.choice(order) for i in range(random.randint(1, 4)))
+                for w in range(40)), key=lambda w: [order.index(l) for l in w])
+            inferer = AlphabetInferer()
+            graph = Graph()
+            for start in range(0, len(words), 7):
+                alphabet = inferer.feed(words[start:start + 7])
+                for l in words[max(0, start - 1)]:
+                    graph.add_vertex(l)
+                for i in range(max(0, start - 1), min(len(words), start + 7) - 1):
+                    let_idx = first_uncommon_letter(words[i], words[i+1])
+                    if let_idx != -1:
+                        graph.add_edge(words[i][let_idx], words[i+1][let_idx])
+                self.assertTrue(self.check_unique(alphabet))
+                for v_from, targets in graph.edges.items():
+                    for v_to in targets:
+                        self.assertTrue(self.check_order(alphabet, v_from, v_to))
+            self.assertEqual(set(alphabet), set(''.join(words)))
+
+    def test_inferer_contradiction(self):
+        inferer = AlphabetInferer()
+        inferer.feed(['A', 'B', 'C'])
+        with self.assertRaises(GraphCycleError) as cm:
+            inferer.feed(['A'])
+        self.assertEqual(cm.exception.vertices, {'A', 'B', 'C'})
+
+
+class TestGraph(unittest.TestCase):
+
+    def check_top_order(self, graph, sorted_list):
+        """ Checks that every vertex appears once and every edge goes forward """
+        position = {v: k for k, v in enumerate(sorted_list)}
+        self.assertEqual(len(position), len(sorted_list))
+        self.assertEqual(set(position), graph.v_sources | graph.v_stocks)
+        for v_from, targets in graph.edges.items():
+            for v_to in targets:
+                self.assertLess(position[v_from], position[v_to])
+
+    def test_kahn(self):
+        graph = Graph()
+        for v_from, v_to in [('A', 'C'), ('B', 'C'), ('C', 'D'), ('B', 'D'), ('E', 'A')]:
+            graph.add_edge(v_from, v_to)
+        graph.add_vertex('F')
+        self.check_top_order(graph, graph.top_sort_kahn())
+        self.assertEqual(graph.top_sort_kahn(lexicographic=True), ['B', 'E', 'A', 'C', 'D', 'F'])
+
+    def test_kahn_deep_chain(self):
+        graph = Graph()
+        for v in range(100000):
+            graph.add_edge(v, v + 1)
+        self.assertEqual(graph.top_sort_kahn(), list(range(100001)))
+
+    def test_kahn_cycle(self):
+        # A -> B -> C -> A is a cycle, D is reachable from it, E leads into it
+        graph = Graph()
+        for v_from, v_to in [('A', 'B'), ('B', 'C'), ('C', 'A'), ('C', 'D'), ('E', 'A')]:
+            graph.add_edge(v_from, v_to)
+        with self.assertRaises(GraphCycleError) as cm:
+            graph.top_sort_kahn()
+        self.assertEqual(cm.exception.vertices, {'A', 'B', 'C'})
+        with self.assertRaises(RuntimeError):
+            graph.top_sort_kahn(lexicographic=True)
+        with self.assertRaises(GraphCycleError) as cm:
+            graph.compile().top_sort()
+        self.assertEqual(cm.exception.vertices, {'A', 'B', 'C'})
+
+    def test_compiled(self):
+        graph = Graph()
+        for v_from, v_to in [('A', 'C'), ('B', 'C'), ('C', 'D'), ('B', 'D'), ('E', 'A'), ('B', 'D')]:
+            graph.add_edge(v_from, v_to)
+        graph.add_vertex('F')
+        compiled = graph.compile()
+        self.assertEqual(compiled.vertices, ['A', 'B', 'C', 'D', 'E', 'F'])
+        self.assertEqual(compiled.successors('B'), ['C', 'D', 'D'])
+        self.assertEqual(compiled.successors('F'), [])
+        self.check_top_order(graph, compiled.top_sort())
+        self.assertEqual(compiled.bfs('E'), ['E', 'A', 'C', 'D'])
+        self.assertEqual(compiled.bfs('B'), ['B', 'C', 'D'])
+        self.assertEqual(Graph().compile().top_sort(), [])
+
+    def test_layers(self):
+        # A -> C -> D, B -> C, B -> D, E -> A, F
+        graph = Graph()
+        for v_from, v_to in [('A', 'C'), ('B', 'C'), ('C', 'D'), ('B', 'D'), ('E', 'A')]:
+            graph.add_edge(v_from, v_to)
+        graph.add_vertex('F')
+        expected = [['B', 'E', 'F'], ['A'], ['C'], ['D']]
+        self.assertEqual([sorted(layer) for layer in graph.top_layers()], expected)
+        self.assertEqual([sorted(layer) for layer in graph.compile().top_layers()], expected)
+        self.assertEqual(graph.critical_path(), ['E', 'A', 'C', 'D'])
+        self.assertEqual(Graph().top_layers(), [])
+        self.assertEqual(Graph().critical_path(), [])
+        graph.add_edge('D', 'E')
+        with self.assertRaises(GraphCycleError):
+            graph.top_layers()
+        with self.assertRaises(GraphCycleError):
+            graph.compile().top_layers()
+
+    def test_compiled_random(self):
+        np.random.seed(0)
+        for k in range(20):
+            n = np.random.randint(1, 50)
+            graph = Graph()
+            for v in range(n):
+                graph.add_vertex(v)
+            for v_from, v_to in np.random.randint(0, n, size=(2 * n, 2)).tolist():
+                if v_from != v_to:
+                    graph.add_edge(min(v_from, v_to), max(v_from, v_to))
+            self.check_top_order(graph, graph.compile().top_sort())
+            layers = graph.top_layers()
+            self.check_top_order(graph, [v for layer in layers for v in layer])
+            path = graph.critical_path()
+            self.assertEqual(len(path), len(layers))
+            for v_from, v_to in zip(path, path[1:]):
+                self.assertIn(v_to, graph.edges[v_from])
+
+    def test_compiled_frontier_paths(self):
+        np.random.seed(1)
+        n = 2000
+        graph = Graph()
+        for v in range(n):
+            graph.add_vertex(v)
+        for v in range(n // 2 - 1):
+            graph.add_edge(v, v + 1)
+        for v_from, v_to in np.random.randint(n // 2, n, size=(2 * n, 2)).tolist():
+            if v_from != v_to:
+                graph.add_edge(min(v_from, v_to), max(v_from, v_to))
+        graph.add_edge(0, n // 2)
+        compiled = graph.compile()
+        self.assertEqual(compiled.scalar_frontier_size, 64)
+        results = []
+        for size in (0, n):
+            compiled.scalar_frontier_size = size
+            results.append((compiled.top_sort(), compiled.top_layers(), compiled.bfs(0)))
+        self.assertEqual(results[0], results[1])
+        self.check_top_order(graph, results[0][0])
+        self.assertEqual([sorted(layer) for layer in results[0][1]],
+                         [sorted(layer) for layer in graph.top_layers()])
+        order, seen = [0], {0}
+        for v in order:
+            for v_to in graph.edges.get(v, ()):
+                if v_to not in seen:
+                    seen.add(v_to)
+                    order.append(v_to)
+        self.assertEqual(sorted(results[0][2]), sorted(order))
+
+
 if __name__ == '__main__':
     unittest.main()
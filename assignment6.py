@@ -1,103 +1,327 @@
 #!/usr/bin/env python3
-from statistics import median
+from array import array
+from contextlib import redirect_stdout
+import io
+import tempfile
 import unittest
 import numpy as np
 
 class RearrangingArray():
 
-	def __init__(self, arrangement, verbose=False):
+	def __init__(self, arrangement, verbose=False, on_move=None):
 
 		self.arrangement = arrangement
 		self.swap_idx = None
 		self.order_dict = None
+		self.keys = None
+		self.position = None
+		self.depth_factor = 2
 		self.verbose = verbose
+		self.on_move = on_move
 
-	def _swap(self, i, j, k):
-		""" Swaps elements on indices i and j using an element on index k """
+	def _log_move(self, i, j):
+		""" Reports a move between positions i and j: prints it if verbose and passes it to on_move """
 		if self.verbose:
-			print(i, k)
 			print(i, j)
-			print(j, k)
-		self.arrangement[i],self.arrangement[k] = self.arrangement[k],self.arrangement[i]
-		self.arrangement[i],self.arrangement[j] = self.arrangement[j],self.arrangement[i]
-		self.arrangement[j],self.arrangement[k] = self.arrangement[k],self.arrangement[j]
+		if self.on_move is not None:
+			self.on_move(i, j)
+
+	def _swap(self, i, j, k):
+		""" Swaps elements on indices i and j using an element on index k """
+		keys = self.keys
+		keys[i], keys[j] = keys[j], keys[i]
+		self.position[keys[i]] = i
+		self.position[keys[j]] = j
+		if self.verbose or (self.on_move is not None):
+			self._log_move(i, k)
+			self._log_move(i, j)
+			self._log_move(j, k)
 
 	def _move_swap_el(self, j):
 		""" Moves the swap element to position j from the current position """
 		i = self.swap_idx
+		keys = self.keys
+		position = self.position
+		logged = self.verbose or (self.on_move is not None)
 		while i < j:
-			if self.verbose:
-				print(i, i+1)
-			self.arrangement[i],self.arrangement[i+1]=self.arrangement[i+1],self.arrangement[i]
+			keys[i], keys[i+1] = keys[i+1], keys[i]
+			position[keys[i]], position[keys[i+1]] = i, i+1
+			if logged:
+				self._log_move(i, i+1)
 			i += 1
 		while i > j:
-			if self.verbose:
-				print(i, i-1)
-			self.arrangement[i],self.arrangement[i-1]=self.arrangement[i-1],self.arrangement[i]
+			keys[i], keys[i-1] = keys[i-1], keys[i]
+			position[keys[i]], position[keys[i-1]] = i, i-1
+			if logged:
+				self._log_move(i, i-1)
 			i -= 1
 		self.swap_idx = j
 
+	def _order_array(self, new_order):
+		""" 
+		Returns a NumPy array of positions in new_order indexed by elements, built with
+		a single vectorized inverse permutation, if the elements are integers 0..n-1.
+		Otherwise returns None
+		"""
+		order = np.asarray(new_order)
+		n = len(order)
+		if (order.ndim == 1) and (order.dtype.kind in 'iu') and \
+				((n == 0) or ((order.min() >= 0) and (order.max() < n))):
+			order_array = np.empty(n, dtype=np.int64)
+			order_array[order] = np.arange(n)
+			return order_array
+		return None
+
 	def _build_dict(self, new_order):
 		""" 
 		Builds a dictionary which defines the desired sorting order
 
 		Input:
-			new_order: List, a permutation of the class arrangement list
+			new_order: List or NumPy array, a permutation of the class arrangement list
 		Output:
 			order_dict: Dict, keys are elements of the list, values are
-						positions in the sorted list
+						positions in the sorted list. If the elements are
+						integers 0..n-1, a List indexed by elements is built
+						instead with a single vectorized inverse permutation
 		"""
+		order_array = self._order_array(new_order)
+		if order_array is not None:
+			return order_array.tolist()
 		order_dict = {}
 		for i, el in enumerate(new_order):
 			order_dict[el] = i
 		return order_dict
 
+	def _build_keys(self, order_array=None):
+		""" 
+		Returns a NumPy array of positions in the sorted list of the elements of
+		the arrangement (keys) and the inverse array of current positions of the keys.
+		order_array is the result of _order_array for the order_dict, if any
+		"""
+		if order_array is not None:
+			keys = order_array[np.asarray(self.arrangement, dtype=np.int64)]
+		else:
+			keys = np.array([self.order_dict[el] for el in self.arrangement], dtype=np.int64)
+		position = np.empty(len(keys), dtype=np.int64)
+		position[keys] = np.arange(len(keys))
+		return keys, position
+
+	def index(self, el):
+		""" Returns the current position of element el in O(1), valid during and after sort """
+		return self.position[self.order_dict[el]]
+
 	def _partition(self, l, r):
 		""" Partition function for QuickSort sorting algorithm """
-		pivot = median([
-			self.order_dict[self.arrangement[l]], 
-			self.order_dict[self.arrangement[(l+r)//2]], 
-			self.order_dict[self.arrangement[r]]]
-		)
+		keys = self.keys
+		position = self.position
+		swap_idx = self.swap_idx
+		logged = self.verbose or (self.on_move is not None)
+		a, b, c = keys[l], keys[(l+r)//2], keys[r]
+		# median of three
+		if a > b:
+			a, b = b, a
+		pivot = b if b < c else (c if a < c else a)
 		while True:
-			while ((self.order_dict[self.arrangement[l]] < pivot) or (l == self.swap_idx)) and (l < r):
+			while ((keys[l] < pivot) or (l == swap_idx)) and (l < r):
 				l += 1
-			while ((self.order_dict[self.arrangement[r]] > pivot) or (r == self.swap_idx)) and (l < r):
+			while ((keys[r] > pivot) or (r == swap_idx)) and (l < r):
 				r -= 1
 			if l == r:
 				break
-			self._swap(l, r, self.swap_idx)
+			if logged:
+				self._swap(l, r, swap_idx)
+			else:
+				key_l, key_r = keys[r], keys[l]
+				keys[l], keys[r] = key_l, key_r
+				position[key_l], position[key_r] = l, r
 		return l
 
 	def _quicksort(self, l, r):
-		""" In-place QuickSort sorting algorithm """
-		if l < r:
-			splitpoint = self._partition(l, r)
-			self._quicksort(l, splitpoint-1)
-			self._quicksort(splitpoint+1, r)
+		""" 
+		In-place QuickSort sorting algorithm without recursion: the larger part
+		goes to an explicit stack and the smaller one is sorted first, so the stack
+		holds O(log n) parts. Parts deeper than depth_factor * log2(n) partitions
+		are sorted with HeapSort instead (introsort), which bounds the work by O(n log n).
+		"""
+		max_depth = self.depth_factor * max(1, r - l + 1).bit_length()
+		stack = [(l, r, 0)]
+		while stack:
+			l, r, depth = stack.pop()
+			while l < r:
+				if depth > max_depth:
+					self._heapsort(l, r)
+					break
+				splitpoint = self._partition(l, r)
+				depth += 1
+				if splitpoint - l < r - splitpoint:
+					stack.append((splitpoint+1, r, depth))
+					r = splitpoint-1
+				else:
+					stack.append((l, splitpoint-1, depth))
+					l = splitpoint+1
+
+	def _heapsort(self, l, r):
+		""" 
+		In-place HeapSort of positions l..r through the empty slot,
+		which should be outside of l..r
+		"""
+		n = r - l + 1
+		for root in range(n//2 - 1, -1, -1):
+			self._sift_down(l, root, n)
+		for end in range(n-1, 0, -1):
+			self._swap(l, l+end, self.swap_idx)
+			self._sift_down(l, 0, end)
+
+	def _sift_down(self, l, root, n):
+		""" Sifts the element on position l+root down the heap of n elements starting at l """
+		keys = self.keys
+		while True:
+			child = 2*root + 1
+			if child >= n:
+				return
+			if (child+1 < n) and (keys[l+child+1] > keys[l+child]):
+				child += 1
+			if keys[l+root] >= keys[l+child]:
+				return
+			self._swap(l+root, l+child, self.swap_idx)
+			root = child
 
 	def sort(self, new_arrangement):
 		""" 
-		Sorts the inner arrangement list in-place according
-		to the order defined by new_arrangement list
+		Sorts the inner arrangement list (or NumPy array) in-place according
+		to the order defined by new_arrangement list.
+		The moves are applied to the list of target positions of the elements (keys),
+		whose elements are written back to the arrangement in the end
 
 		Input:
-			new_arrangement: List, a permutation of the class arrangement list
+			new_arrangement: List or NumPy array, a permutation of the class arrangement list
 		"""
-		self.order_dict = self._build_dict(new_arrangement)
-		self.swap_idx = self.arrangement.index(0)
+		order_array = self._order_array(new_arrangement)
+		if order_array is not None:
+			self.order_dict = order_array.tolist()
+		else:
+			self.order_dict = self._build_dict(new_arrangement)
+		keys, position = self._build_keys(order_array)
+		# the partitions index single keys, which is cheaper on lists than on NumPy arrays
+		self.keys, self.position = keys.tolist(), position.tolist()
+		self.swap_idx = self.index(0)
 		self._move_swap_el(len(new_arrangement)-1)
-		l = self._quicksort(0, len(new_arrangement)-2)
+		self._quicksort(0, len(new_arrangement)-2)
 		self._move_swap_el(self.order_dict[0])
+		if order_array is not None:
+			# integer elements are the inverse permutation of order_array
+			elements = np.empty_like(order_array)
+			elements[order_array] = np.arange(len(order_array))
+			elements = elements[np.asarray(self.keys, dtype=np.int64)]
+			self.arrangement[:] = elements if isinstance(self.arrangement, np.ndarray) else elements.tolist()
+		else:
+			self.arrangement[:] = [new_arrangement[key] for key in self.keys]
+
+	def sort_cycles(self, new_arrangement):
+		""" 
+		Sorts the inner arrangement list in-place according to the order
+		defined by new_arrangement list with the minimal number of moves.
+		The permutation is resolved cycle by cycle through the empty slot (element 0):
+		every misplaced element is moved once straight to its place, plus one extra
+		move for every cycle without the empty slot. Runs in O(n).
+		With verbose=True every move is printed as "from to" positions
+
+		Input:
+			new_arrangement: List, a permutation of the class arrangement list
+		"""
+		for src, dst in self.iter_moves(new_arrangement):
+			if self.verbose or (self.on_move is not None):
+				self._log_move(src, dst)
+
+	def iter_moves(self, new_arrangement):
+		""" 
+		Generator version of sort_cycles: yields every move as a (from, to) pair of
+		positions right after it is applied to the inner arrangement list, so the plan
+		is never held in memory. The arrangement is sorted when the generator is exhausted
+		"""
+		arrangement = self.arrangement
+		position = self._build_dict(arrangement)
+		empty = position[0]
+		scan = 0
+		while True:
+			if new_arrangement[empty] != 0:
+				# bring the element which belongs to the empty slot
+				src = position[new_arrangement[empty]]
+			else:
+				# the empty slot is in place: open the next cycle
+				while (scan < len(arrangement)) and (arrangement[scan] == new_arrangement[scan]):
+					scan += 1
+				if scan == len(arrangement):
+					break
+				src = scan
+			arrangement[empty], arrangement[src] = arrangement[src], arrangement[empty]
+			position[arrangement[empty]] = empty
+			self.swap_idx = src
+			yield src, empty
+			empty = src
+
+	def write_moves(self, new_arrangement, f, batch_size=65536):
+		""" 
+		Sorts the inner arrangement list like sort_cycles, writing the moves to a binary
+		file object f in batches of batch_size moves: every move is a pair of signed
+		64-bit integers (from, to) in native byte order. Returns the number of moves
+		"""
+		batch = array('q')
+		n_moves = 0
+		for move in self.iter_moves(new_arrangement):
+			batch.extend(move)
+			if len(batch) >= 2 * batch_size:
+				batch.tofile(f)
+				n_moves += len(batch) // 2
+				del batch[:]
+		batch.tofile(f)
+		return n_moves + len(batch) // 2
+
+	def move_count(self, new_arrangement):
+		""" 
+		Dry run of sort_cycles: returns the number of moves it would make
+		without moving anything. A cycle of L misplaced elements costs L-1 moves
+		if it contains the empty slot and L+1 moves otherwise
+		"""
+		position = self._build_dict(self.arrangement)
+		visited = bytearray(len(new_arrangement))
+		n_moves = 0
+		for start in range(len(new_arrangement)):
+			if visited[start] or (self.arrangement[start] == new_arrangement[start]):
+				continue
+			length = 0
+			has_empty = False
+			p = start
+			while not visited[p]:
+				visited[p] = 1
+				length += 1
+				has_empty = has_empty or (self.arrangement[p] == 0)
+				p = position[new_arrangement[p]]
+			n_moves += length - 1 if has_empty else length + 1
+		return n_moves
 
 
 class TestRearranging(unittest.TestCase):
 
+	def replay(self, init_order):
+		""" Returns a copy of init_order and an on_move callback applying the moves to it """
+		replay = list(init_order)
+		def replay_move(i, j):
+			self.assertIn(0, (replay[i], replay[j]))
+			replay[i], replay[j] = replay[j], replay[i]
+		return replay, replay_move
+
 	def test_simple(self):
 
 		init_order = [1, 2, 0, 3]
 		new_order = [3, 1, 2, 0]
-		rarr = RearrangingArray(init_order, verbose=False)
+		replay, replay_move = self.replay(init_order)
+		rarr = RearrangingArray(list(init_order), verbose=False, on_move=replay_move)
+		rarr.sort(new_order)
+		self.assertEqual(replay, new_order)
+		self.assertEqual(rarr.arrangement, new_order)
+
+		rarr = RearrangingArray(list(init_order))
 		rarr.sort(new_order)
 		self.assertEqual(rarr.arrangement, new_order)
 
@@ -108,9 +332,191 @@ class TestRearranging(unittest.TestCase):
 			init_order = list(np.random.permutation(np.arange(j)))
 			np.random.seed(j * 2)
 			new_order = list(np.random.permutation(np.arange(j)))
-			rarr = RearrangingArray(init_order)
+			rarr = RearrangingArray(list(init_order))
 			rarr.sort(new_order)
 			self.assertEqual(rarr.arrangement, new_order)
+			if j % 100 == 1:
+				# the logged moves make the same arrangement
+				replay, replay_move = self.replay(init_order)
+				rarr = RearrangingArray(list(init_order), on_move=replay_move)
+				rarr.sort(new_order)
+				self.assertEqual(replay, new_order)
+				self.assertEqual(rarr.arrangement, new_order)
+
+	def test_position_index(self):
+
+		np.random.seed(1)
+		init_order = list(np.random.permutation(50))
+		new_order = list(np.random.permutation(50))
+		replay, replay_move = self.replay(init_order)
+		def check_move(i, j):
+			replay_move(i, j)
+			# the index follows the swaps of keys, which are made before their moves are logged
+			self.assertEqual([rarr.position[key] for key in rarr.keys], list(range(50)))
+		rarr = RearrangingArray(list(init_order), on_move=check_move)
+		rarr.sort(new_order)
+		self.assertEqual(replay, new_order)
+		self.assertEqual([rarr.index(el) for el in new_order], list(range(50)))
+		rarr = RearrangingArray(list(init_order))
+		rarr.sort(new_order)
+		self.assertEqual([rarr.index(el) for el in new_order], list(range(50)))
+
+	def test_cycles(self):
+
+		init_order = [1, 2, 0, 3]
+		new_order = [3, 1, 2, 0]
+		rarr = RearrangingArray(init_order)
+		rarr.sort_cycles(new_order)
+		self.assertEqual(rarr.arrangement, new_order)
+
+		# two 2-cycles without the empty slot: 4 misplaced elements + 2 cycles
+		rarr = RearrangingArray([0, 2, 1, 4, 3], verbose=True)
+		with redirect_stdout(io.StringIO()) as moves:
+			rarr.sort_cycles([0, 1, 2, 3, 4])
+		self.assertEqual(rarr.arrangement, [0, 1, 2, 3, 4])
+		self.assertEqual(len(moves.getvalue().splitlines()), 6)
+
+	def test_cycles_random(self):
+
+		for j in range(1, 2001, 10):
+			np.random.seed(j)
+			init_order = list(np.random.permutation(np.arange(j)))
+			np.random.seed(j * 2)
+			new_order = list(np.random.permutation(np.arange(j)))
+			rarr = RearrangingArray(list(init_order), verbose=True)
+			with redirect_stdout(io.StringIO()) as moves:
+				rarr.sort_cycles(new_order)
+			self.assertEqual(rarr.arrangement, new_order)
+			# replay the printed moves and check that every one goes through the empty slot
+			replay = list(init_order)
+			for line in moves.getvalue().splitlines():
+				src, dst = map(int, line.split())
+				self.assertEqual(replay[dst], 0)
+				replay[src], replay[dst] = replay[dst], replay[src]
+			self.assertEqual(replay, new_order)
+
+
+	def test_move_plan(self):
+
+		for j in range(1, 502, 20):
+			np.random.seed(j)
+			init_order = list(np.random.permutation(np.arange(j)))
+			np.random.seed(j * 2)
+			new_order = list(np.random.permutation(np.arange(j)))
+			rarr = RearrangingArray(list(init_order))
+			n_moves = rarr.move_count(new_order)
+			self.assertEqual(rarr.arrangement, init_order)
+			moves = []
+			for src, dst in rarr.iter_moves(new_order):
+				self.assertEqual(rarr.arrangement[src], 0)
+				moves.append((src, dst))
+			self.assertEqual(rarr.arrangement, new_order)
+			self.assertEqual(len(moves), n_moves)
+
+			with tempfile.TemporaryFile() as f:
+				rarr = RearrangingArray(list(init_order))
+				self.assertEqual(rarr.write_moves(new_order, f, batch_size=7), n_moves)
+				f.seek(0)
+				written = array('q', f.read())
+			self.assertEqual(list(zip(written[::2], written[1::2])), moves)
+
+			# the quicksort engine reports moves through on_move as well
+			replay = list(init_order)
+			def replay_move(i, j):
+				replay[i], replay[j] = replay[j], replay[i]
+			RearrangingArray(list(init_order), on_move=replay_move).sort(new_order)
+			self.assertEqual(replay, new_order)
+
+
+	def test_numpy_arrays(self):
+
+		np.random.seed(0)
+		init_order = np.random.permutation(1000)
+		new_order = np.random.permutation(1000)
+		for sort_method in ('sort', 'sort_cycles'):
+			arrangement = init_order.copy()
+			rarr = RearrangingArray(arrangement)
+			getattr(rarr, sort_method)(new_order)
+			self.assertIs(rarr.arrangement, arrangement)
+			self.assertTrue(np.array_equal(arrangement, new_order))
+
+	def test_non_integer_elements(self):
+
+		init_order = ['b', 0, 'a', 'c']
+		new_order = ['c', 'a', 0, 'b']
+		rarr = RearrangingArray(list(init_order))
+		rarr.sort(new_order)
+		self.assertEqual(rarr.arrangement, new_order)
+		rarr = RearrangingArray(list(init_order))
+		rarr.sort_cycles(new_order)
+		self.assertEqual(rarr.arrangement, new_order)
+
+
+	def test_introsort_fallback(self):
+
+		for depth_factor in (0, 1):
+			for j in (2, 3, 10, 101, 2000):
+				np.random.seed(j)
+				init_order = list(range(j))
+				np.random.shuffle(init_order)
+				new_order = list(range(j))
+				replay = list(init_order)
+				def replay_move(i, k):
+					self.assertIn(0, (replay[i], replay[k]))
+					replay[i], replay[k] = replay[k], replay[i]
+				rarr = RearrangingArray(list(init_order), on_move=replay_move)
+				rarr.depth_factor = depth_factor
+				rarr.sort(new_order)
+				self.assertEqual(rarr.arrangement, new_order)
+				self.assertEqual(replay, new_order)
+
+	def test_adversarial_large(self):
+
+		# McIlroy's adversary builds a median-of-three killer: keys are frozen to the
+		# smallest free value only when two unfrozen keys are compared, so every
+		# partition splits off O(1) keys and the quicksort goes O(n) deep
+		n = 100000
+		frozen = []
+		class Gas():
+			def __init__(self):
+				self.value = None
+			def _freeze(self, other):
+				if (self.value is None) and (other.value is None):
+					self.value = len(frozen)
+					frozen.append(self)
+				return self.value, other.value
+			def __lt__(self, other):
+				a, b = self._freeze(other)
+				return (a is not None) and ((b is None) or (a < b))
+			def __gt__(self, other):
+				a, b = self._freeze(other)
+				return (b is not None) and ((a is None) or (a > b))
+		keys = [Gas() for i in range(n-1)]
+		rarr = RearrangingArray([0], on_move=lambda i, j: None)
+		rarr.keys, rarr.position, rarr.swap_idx = list(keys) + [None], {}, n-1
+		rarr._heapsort = lambda l, r: None
+		rarr._quicksort(0, n-2)
+		for key in keys:
+			if key.value is None:
+				key.value = len(frozen)
+				frozen.append(key)
+
+		# the empty slot is already at the end, the target is 0..n-1
+		init_order = [key.value + 1 for key in keys] + [0]
+		new_order = list(range(n))
+		replay, replay_move = self.replay(init_order)
+		rarr = RearrangingArray(list(init_order), on_move=replay_move)
+		self.assertEqual(rarr.depth_factor, 2)
+		heapsorted = []
+		heapsort = rarr._heapsort
+		def count_heapsort(l, r):
+			heapsorted.append(r - l + 1)
+			heapsort(l, r)
+		rarr._heapsort = count_heapsort
+		rarr.sort(new_order)
+		self.assertEqual(replay, new_order)
+		self.assertEqual(rarr.arrangement, new_order)
+		self.assertGreater(sum(heapsorted), n // 2)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the RearrangingArray engines over sizes and permutation structures.
+Reports wall time, number of moves and peak memory and stores the results
+as JSON, so that two runs can be compared for regressions:
+
+	python3 assignment6_benchmark.py --output new.json --compare old.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import unittest
+import numpy as np
+from assignment6 import RearrangingArray
+
+ENGINES = ('quicksort', 'cycles')
+STRUCTURES = ('random', 'nearly_sorted', 'reversed', 'few_long_cycles')
+
+
+def make_orders(structure, n, seed=0):
+	"""
+	Returns (init_order, new_order) lists, permutations of 0..n-1 where 0 is the empty slot.
+	new_order is random, init_order is new_order permuted according to structure:
+		random: a random permutation
+		nearly_sorted: n // 100 + 1 random transpositions of neighbours
+		reversed: new_order reversed
+		few_long_cycles: a permutation made of 3 cycles of random lengths
+	"""
+	rng = np.random.RandomState(seed)
+	new_order = rng.permutation(n)
+	if structure == 'random':
+		init_order = rng.permutation(n)
+	elif structure == 'nearly_sorted':
+		init_order = new_order.copy()
+		if n > 1:
+			for i in rng.randint(0, n - 1, size=n // 100 + 1).tolist():
+				init_order[i], init_order[i+1] = init_order[i+1], init_order[i]
+	elif structure == 'reversed':
+		init_order = new_order[::-1].copy()
+	elif structure == 'few_long_cycles':
+		positions = rng.permutation(n)
+		cuts = np.sort(rng.choice(np.arange(1, n), size=min(2, max(0, n - 1)), replace=False))
+		init_order = new_order.copy()
+		for cycle in np.split(positions, cuts):
+			init_order[cycle] = new_order[np.roll(cycle, 1)]
+	else:
+		raise RuntimeError('Unknown permutation structure: {0}'.format(structure))
+	return init_order.tolist(), new_order.tolist()
+
+
+def run_engine(engine, init_order, new_order, on_move=None):
+	""" Rearranges a copy of init_order into new_order with the engine, returns the array """
+	rarr = RearrangingArray(list(init_order), on_move=on_move)
+	if engine == 'quicksort':
+		rarr.sort(new_order)
+	elif engine == 'cycles':
+		rarr.sort_cycles(new_order)
+	else:
+		raise RuntimeError('Unknown engine: {0}'.format(engine))
+	return rarr
+
+
+def move_counter():
+	""" Returns a cheap on_move callback which only counts the moves and a list holding the count """
+	count = [0]
+	def move(i, j):
+		count[0] += 1
+	return move, count
+
+
+def replay_moves(engine, init_order, new_order):
+	"""
+	Runs the engine reporting its moves through on_move and applies them to a copy
+	of init_order. Returns the copy and the number of moves
+	"""
+	replay = list(init_order)
+	moves = [0]
+	def move(i, j):
+		replay[i], replay[j] = replay[j], replay[i]
+		moves[0] += 1
+	run_engine(engine, init_order, new_order, on_move=move)
+	return replay, moves[0]
+
+
+def benchmark(sizes, engines=ENGINES, structures=STRUCTURES, max_quicksort_size=10**5,
+		measure_memory=True, seed=0):
+	"""
+	Runs every engine on every structure and size. Returns a list of dicts with
+	engine, structure, size, seconds (wall time of the rearrangement),
+	moves and peak_bytes (peak of memory allocated by the run, None if not measured).
+	The timed and the measured runs count their moves through on_move, so they take
+	the same code path as the replayed run which checks the result
+	"""
+	results = []
+	for structure in structures:
+		for n in sizes:
+			init_order, new_order = make_orders(structure, n, seed)
+			for engine in engines:
+				if (engine == 'quicksort') and (n > max_quicksort_size):
+					continue
+				count_move, count = move_counter()
+				start = time.perf_counter()
+				run_engine(engine, init_order, new_order, on_move=count_move)
+				seconds = time.perf_counter() - start
+				moves = count[0]
+				replay, replayed = replay_moves(engine, init_order, new_order)
+				if (replay != new_order) or (replayed != moves):
+					raise RuntimeError('{0} engine failed on {1} of size {2}'.format(engine, structure, n))
+				peak_bytes = None
+				if measure_memory:
+					count_move, count = move_counter()
+					tracemalloc.start()
+					run_engine(engine, init_order, new_order, on_move=count_move)
+					peak_bytes = tracemalloc.get_traced_memory()[1]
+					tracemalloc.stop()
+				results.append({
+					'engine': engine,
+					'structure': structure,
+					'size': n,
+					'seconds': seconds,
+					'moves': moves,
+					'peak_bytes': peak_bytes,
+				})
+	return results
+
+
+def compare(old_results, new_results, tolerance=0.2):
+	"""
+	Returns descriptions of the regressions of new_results against old_results:
+	runs which got slower by more than tolerance (a fraction) or make more moves
+	"""
+	old = {(r['engine'], r['structure'], r['size']): r for r in old_results}
+	regressions = []
+	for r in new_results:
+		key = (r['engine'], r['structure'], r['size'])
+		if key not in old:
+			continue
+		if r['moves'] > old[key]['moves']:
+			regressions.append('{0} {1} {2}: moves {3} -> {4}'.format(
+				key[0], key[1], key[2], old[key]['moves'], r['moves']))
+		if r['seconds'] > old[key]['seconds'] * (1 + tolerance):
+			regressions.append('{0} {1} {2}: time {3:.4f}s -> {4:.4f}s'.format(
+				key[0], key[1], key[2], old[key]['seconds'], r['seconds']))
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark of RearrangingArray engines')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[10**k for k in range(1, 8)])
+	parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+	parser.add_argument('--structures', nargs='+', choices=STRUCTURES, default=list(STRUCTURES))
+	parser.add_argument('--max-quicksort-size', type=int, default=10**5)
+	parser.add_argument('--no-memory', action='store_true', help='skip peak memory measurement')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--output', help='JSON file for the results, stdout by default')
+	parser.add_argument('--compare', help='JSON file of a previous run to check for regressions')
+	parser.add_argument('--tolerance', type=float, default=0.2)
+	args = parser.parse_args(argv)
+
+	report = {
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'results': benchmark(args.sizes, args.engines, args.structures,
+			args.max_quicksort_size, not args.no_memory, args.seed),
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1)
+	else:
+		json.dump(report, sys.stdout, indent=1)
+		print()
+	if args.compare:
+		with open(args.compare) as f:
+			regressions = compare(json.load(f)['results'], report['results'], args.tolerance)
+		for line in regressions:
+			print(line, file=sys.stderr)
+		return 1 if regressions else 0
+	return 0
+
+
+class TestBenchmark(unittest.TestCase):
+
+	def test_orders(self):
+		for structure in STRUCTURES:
+			for n in (1, 2, 10, 57):
+				init_order, new_order = make_orders(structure, n)
+				self.assertEqual(sorted(init_order), list(range(n)))
+				self.assertEqual(sorted(new_order), list(range(n)))
+
+	def test_replay(self):
+		init_order, new_order = make_orders('random', 300)
+		for engine in ENGINES:
+			replay, moves = replay_moves(engine, init_order, new_order)
+			self.assertEqual(replay, new_order)
+			self.assertGreaterEqual(moves, RearrangingArray(list(init_order)).move_count(new_order))
+
+	def test_benchmark(self):
+		results = benchmark([10, 100])
+		self.assertEqual(len(results), len(ENGINES) * len(STRUCTURES) * 2)
+		for r in results:
+			init_order, new_order = make_orders(r['structure'], r['size'])
+			self.assertGreaterEqual(r['moves'], RearrangingArray(init_order).move_count(new_order))
+			self.assertIsNotNone(r['peak_bytes'])
+		self.assertEqual(compare(results, results), [])
+		slower = [dict(r, seconds=r['seconds'] * 2 + 1, moves=r['moves'] + 1) for r in results[:1]]
+		self.assertEqual(len(compare(results, slower)), 2)
+
+
+if __name__ == '__main__':
+	sys.exit(main())